@@ -1,7 +1,12 @@
+import hashlib
 import os
+import re
 import sys
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 def env(name):
     value = os.environ.get(name)
@@ -10,16 +15,37 @@ def env(name):
         sys.exit(1)
     return value
 
+CONNECT_TIMEOUT = 3.0
+
 class PortainerClient:
-    def __init__(self, portainer_url, api_key):
+    def __init__(self, portainer_url, api_key, swarm_id=None):
         self.portainer_url = portainer_url
-        self.headers = {"X-API-Key": api_key, "Content-Type": "application/json"}
+        self.swarm_id = swarm_id
+        self.session = requests.Session()
+        self.session.headers.update({"X-API-Key": api_key, "Content-Type": "application/json"})
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            # Only GETs are retried; a repeated PUT/POST could deploy twice
+            max_retries=Retry(
+                total=3,
+                connect=3,
+                read=0,
+                status=3,
+                status_forcelist=[502, 503, 504],
+                allowed_methods={"GET"},
+                backoff_factor=0.5,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
     
     def _make_request(self, method, endpoint, **kwargs):
         """Make HTTP request with common error handling"""
         url = f"{self.portainer_url}{endpoint}"
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, 30))
         try:
-            response = requests.request(method, url, headers=self.headers, **kwargs)
+            response = self.session.request(method, url, **kwargs)
             response.raise_for_status()
             return response
         except requests.exceptions.RequestException as e:
@@ -28,14 +54,15 @@ class PortainerClient:
                 print(f"Response body: {e.response.text}", file=sys.stderr)
             sys.exit(1)
     
-    def get_stacks(self):
-        """Get all stacks"""
-        response = self._make_request("GET", "/api/stacks", timeout=30)
+    def get_stacks(self, filters=None):
+        """Get stacks, optionally narrowed server-side by Portainer filters"""
+        params = {"filters": json.dumps(filters)} if filters else None
+        response = self._make_request("GET", "/api/stacks", params=params, timeout=(CONNECT_TIMEOUT, 30))
         return response.json()
     
     def get_stack_id(self, stack_name):
         """Get stack ID by name, returns None if not found"""
-        stacks = self.get_stacks()
+        stacks = self.get_stacks({"SwarmID": self.swarm_id} if self.swarm_id else None)
         for stack in stacks:
             if stack["Name"] == stack_name:
                 return stack["Id"]
@@ -43,9 +70,14 @@ class PortainerClient:
     
     def get_stack_details(self, stack_id):
         """Get stack details by ID"""
-        response = self._make_request("GET", f"/api/stacks/{stack_id}", timeout=30)
+        response = self._make_request("GET", f"/api/stacks/{stack_id}", timeout=(CONNECT_TIMEOUT, 30))
         return response.json()
     
+    def get_stack_file(self, stack_id):
+        """Get the compose file currently deployed for a stack"""
+        response = self._make_request("GET", f"/api/stacks/{stack_id}/file", timeout=(CONNECT_TIMEOUT, 30))
+        return response.json().get("StackFileContent", "")
+    
     def create_stack(self, stack_name, swarm_id, endpoint_id, stack_file_content):
         """Create a new stack"""
         payload = {
@@ -60,7 +92,7 @@ class PortainerClient:
             "POST", 
             f"/api/stacks/create/swarm/string?endpointId={endpoint_id}",
             data=json.dumps(payload),
-            timeout=60
+            timeout=(CONNECT_TIMEOUT, 60)
         )
         result = response.json()
         print(f"Stack '{stack_name}' created successfully with ID: {result.get('Id')}")
@@ -72,18 +104,21 @@ class PortainerClient:
             "PUT",
             f"/api/stacks/{stack_id}?endpointId={endpoint_id}",
             data=json.dumps(payload),
-            timeout=60
+            timeout=(CONNECT_TIMEOUT, 60)
         )
         print("Stack update request sent to Portainer successfully.")
 
+ENV_VAR_PATTERN = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
 def render_docker_compose():
     with open("docker-compose.yml", "r") as f:
         content = f.read()
     
-    for key, value in os.environ.items():
-        content = content.replace(f"${{{key}}}", value)
-    
-    return content
+    # Single pass; unknown variables are left untouched
+    return ENV_VAR_PATTERN.sub(lambda m: os.environ.get(m.group(1), m.group(0)), content)
+
+def content_hash(content):
+    return hashlib.sha256(content.encode()).hexdigest()
 
 def main():
     portainer_url = env("PORTAINER_URL")
@@ -95,20 +130,32 @@ def main():
     print(f"Starting redeployment for stack: {stack_name}")
     
     try:
-        client = PortainerClient(portainer_url, api_key)
-        stack_file_content = render_docker_compose()
+        client = PortainerClient(portainer_url, api_key, swarm_id)
 
-        print("Rendered docker-compose.yml:")
-        print(stack_file_content)
-        
-        stack_id = client.get_stack_id(stack_name)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            # Look the stack up while the compose file is being rendered
+            stack_id_future = pool.submit(client.get_stack_id, stack_name)
+            stack_file_content = render_docker_compose()
+
+            print("Rendered docker-compose.yml:")
+            print(stack_file_content)
+
+            stack_id = stack_id_future.result()
+
+            if stack_id is not None:
+                print(f"Found existing stack with ID: {stack_id}")
+                deployed_future = pool.submit(client.get_stack_file, stack_id)
+                details_future = pool.submit(client.get_stack_details, stack_id)
+                deployed_content = deployed_future.result()
+                stack_details = details_future.result()
         
         if stack_id is None:
             print(f"Stack '{stack_name}' not found. Creating new stack...")
             client.create_stack(stack_name, swarm_id, endpoint_id, stack_file_content)
         else:
-            print(f"Found existing stack with ID: {stack_id}")
-            stack_details = client.get_stack_details(stack_id)
+            if content_hash(deployed_content) == content_hash(stack_file_content):
+                print("Deployed docker-compose.yml is unchanged, skipping update.")
+                return
             
             update_payload = {
                 "StackFileContent": stack_file_content,
@@ -1,5 +1,9 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 import io
+import mmap
+import struct
 
 import shutil
 from pytz import UTC
@@ -8,12 +12,12 @@ import ffmpeg
 import wave
 
 import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
 
 import os
 import logging
 
-import base64
-
 from lib.resources import call_resource
 
 from utils import sample_rate, sha, TMP_DIR
@@ -24,16 +28,43 @@ import subprocess
 logger = logging.getLogger('chunking')
 
 CHUNK_MAX_LEN = timedelta(seconds=10)
+INGEST_BATCH_SIZE = 100
+DECODE_WORKERS = 4
 
 
 def get_tmp_dir(original):
     return os.path.join(TMP_DIR, sha(original))
 
+CHUNKS_DONE_MARKER = '.done'
+
+
+def get_fingerprint(path) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def list_opus_chunks(dest_dir):
+    with os.scandir(dest_dir) as entries:
+        names = sorted(e.name for e in entries if e.is_file() and e.name.endswith('.opus'))
+    return [
+        (i * CHUNK_MAX_LEN, os.path.join(dest_dir, name))
+        for i, name in enumerate(names)
+    ]
+
+
 def split_to_opus_chunks(original, *, quiet=False):
     dest_dir = get_tmp_dir(original)
+    marker = os.path.join(dest_dir, CHUNKS_DONE_MARKER)
+    fingerprint = get_fingerprint(original)
+
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == fingerprint:
+                logger.debug("reusing cached chunks of '%s'", original)
+                return list_opus_chunks(dest_dir)
 
-    if os.path.exists(dest_dir):
-        os.rmdir(dest_dir)
+    # missing or stale marker means a partial or outdated split
+    shutil.rmtree(dest_dir, ignore_errors=True)
     os.makedirs(dest_dir, exist_ok=True)
 
     command = [
@@ -41,6 +72,7 @@ def split_to_opus_chunks(original, *, quiet=False):
         '-i', original,
         '-f', 'segment',
         '-segment_time', str(int(CHUNK_MAX_LEN.total_seconds())),
+        '-reset_timestamps', '1',
         '-acodec', 'libopus',
         '-map_metadata', '-1',
         os.path.join(dest_dir, "%010d.opus"),
@@ -56,10 +88,10 @@ def split_to_opus_chunks(original, *, quiet=False):
         stderr=subprocess.STDOUT  # Capture error messages as part of stdout
     )
 
-    return [
-        (i * CHUNK_MAX_LEN, os.path.join(dest_dir, f))
-        for i, f in enumerate(sorted(os.listdir(dest_dir)))
-    ]
+    with open(marker, 'w') as f:
+        f.write(fingerprint)
+
+    return list_opus_chunks(dest_dir)
 
 def get_os_metadata(file):
     stat = os.stat(file)
@@ -86,8 +118,9 @@ def wav_to_array(source: io.BytesIO) -> np.ndarray:
     else:
         raise ValueError("Unsupported sample width")
 
-    # Normalize to float between -1.0 and 1.0
-    return data.astype(np.float32) / np.iinfo(data.dtype).max
+    # Normalize to float between -1.0 and 1.0, staying in float32 throughout
+    scale = np.float32(1.0 / np.iinfo(data.dtype).max)
+    return np.multiply(data, scale, dtype=np.float32)
 
 def array_to_wav(audio_data: np.ndarray, sample_rate=16000) -> io.BytesIO:
     """
@@ -101,7 +134,7 @@ def array_to_wav(audio_data: np.ndarray, sample_rate=16000) -> io.BytesIO:
         io.BytesIO: WAV file in memory
     """
     # Convert to 16-bit PCM
-    audio_data = (audio_data * 32767).astype(np.int16)
+    audio_data = (audio_data * np.float32(32767)).astype(np.int16)
 
     # Create BytesIO object
     wav_buffer = io.BytesIO()
@@ -116,7 +149,102 @@ def array_to_wav(audio_data: np.ndarray, sample_rate=16000) -> io.BytesIO:
     return wav_buffer
 
 
+def decode_opus(source: bytes, sample_rate: int = sample_rate) -> np.ndarray:
+    """
+    Decode an Ogg/Opus blob in-process via libsndfile, downmixed to mono
+    and resampled to `sample_rate`.
+    """
+    data, native_rate = sf.read(io.BytesIO(source), dtype='float32', always_2d=False)
+    if data.ndim > 1:
+        data = data.mean(axis=1, dtype=np.float32)
+    if native_rate != sample_rate:
+        data = resample_poly(data, sample_rate, native_rate).astype(np.float32, copy=False)
+    return data
+
+
+OPUS_GRANULE_RATE = 48000
+# samples per frame at 48 kHz by TOC config (RFC 6716 section 3.1):
+# SILK 10/20/40/60 ms, hybrid 10/20 ms, CELT 2.5/5/10/20 ms
+OPUS_FRAME_SAMPLES = [480, 960, 1920, 2880] * 3 + [480, 960] * 2 + [120, 240, 480, 960] * 4
+
+
+def opus_packet_samples(packet: bytes) -> int:
+    if not packet:
+        return 0
+    toc = packet[0]
+    code = toc & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    elif len(packet) > 1:
+        frames = packet[1] & 0x3F
+    else:
+        raise ValueError("truncated Opus packet")
+    return OPUS_FRAME_SAMPLES[toc >> 3] * frames
+
+
+def opus_duration(source: bytes) -> float:
+    """
+    Duration of an Ogg/Opus blob in seconds, from the granule positions of
+    its first and last audio pages. Only page headers and packet TOC bytes
+    are read; no audio is decoded.
+    """
+    # a segment cut from a longer recording may keep the source timeline, so
+    # the first audio page's granule minus its own samples gives the start
+    granule = pre_skip = start_granule = None
+    packets = 0
+    pending_samples = 0
+    # first two bytes (all the TOC needs) of a packet still being laced,
+    # which may continue onto the next page
+    packet_head = None
+    pos = 0
+    while pos < len(source):
+        # page header: "OggS" version flags granule(8) serial(4) seq(4) crc(4) segments(1)
+        if source[pos:pos + 4] != b'OggS' or pos + 27 > len(source):
+            raise ValueError(f"no Ogg page at offset {pos}")
+        [page_granule] = struct.unpack_from('<q', source, pos + 6)
+        segments = source[pos + 26]
+        body = pos + 27 + segments
+        if pre_skip is None:
+            # OpusHead: magic(8) version(1) channels(1) pre-skip(2)
+            if source[body:body + 8] != b'OpusHead' or body + 12 > len(source):
+                raise ValueError("not an Ogg/Opus stream")
+            [pre_skip] = struct.unpack_from('<H', source, body + 10)
+
+        if not source[pos + 5] & 0x01:
+            # not a continued page, so no packet carries over from the last one
+            packet_head = None
+        end = body
+        for lacing in source[pos + 27:body]:
+            if packet_head is None:
+                packet_head = source[end:end + min(lacing, 2)]
+            end += lacing
+            if lacing < 255:
+                # the first two packets are OpusHead and OpusTags
+                if packets >= 2 and start_granule is None:
+                    pending_samples += opus_packet_samples(packet_head)
+                packets += 1
+                packet_head = None
+
+        if page_granule != -1 and packets > 2:
+            if start_granule is None:
+                start_granule = page_granule - pending_samples
+            granule = page_granule
+        pos = end
+    if granule is None:
+        raise ValueError("Ogg stream has no audio pages")
+    return max(granule - start_granule - pre_skip, 0) / OPUS_GRANULE_RATE
+
+
 def read_codec(source: bytes, codec: str, sample_rate: int = sample_rate) -> np.ndarray:
+    if codec == "opus":
+        try:
+            return decode_opus(source, sample_rate)
+        except sf.LibsndfileError as e:
+            # libsndfile builds without opus support fall back to ffmpeg
+            logger.debug("in-process opus decode failed, falling back to ffmpeg: %s", e)
+
     process = (
         ffmpeg
         .input('pipe:', codec=codec)
@@ -183,14 +311,20 @@ class AudioChunkReader:
             start_at,
             fetch_batch_size: int,
             sample_rate: int,
+            decode_workers: int = DECODE_WORKERS,
         ):
         self.sample_rate = sample_rate
+        self.executor = ThreadPoolExecutor(max_workers=decode_workers)
+        self.prefetch = decode_workers
+        self.pending: deque[tuple[dict, Future]] = deque()
         if isinstance(start_at, (int, float)):
             self.cursor = datetime.fromtimestamp(start_at, tz=UTC)
         elif isinstance(start_at, datetime):
             self.cursor = start_at
         else:
             raise ValueError("start_at must be a float (UTC timestamp) or datetime object.")
+        self._t0 = self.cursor
+        self._cursor_samples = 0
         self.chunks = db_collection.find(
             {
                 **filter_chunks,
@@ -198,6 +332,28 @@ class AudioChunkReader:
             }
         ).sort("start", 1).batch_size(fetch_batch_size)
 
+    def _next_decoded(self) -> tuple[dict, np.ndarray]:
+        """
+        Return the next chunk with its decoded audio, keeping up to
+        `prefetch` ffmpeg decodes of the following chunks in flight.
+        """
+        while len(self.pending) < self.prefetch:
+            try:
+                chunk = self.chunks.next()
+            except StopIteration:
+                break
+            future = self.executor.submit(read_codec, chunk["data"], codec="opus", sample_rate=self.sample_rate)
+            self.pending.append((chunk, future))
+
+        if not self.pending:
+            raise StopIteration
+        chunk, future = self.pending.popleft()
+        return chunk, future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.pending.clear()
+
     def read(self, duration: int | float | timedelta = None, **kwargs) -> np.array:
         """
         Read audio chunks from the database and concatenate them into a single array.
@@ -211,20 +367,19 @@ class AudioChunkReader:
         elif kwargs:
             duration = timedelta(**kwargs)
 
-        start = self.cursor
+        # Track the cursor as an integer sample offset from `_t0` inside the
+        # loop and only convert back to a datetime once at the end
+        target = self._cursor_samples + int(duration.total_seconds() * self.sample_rate)
         result = []
 
-        while self.cursor - start < duration:
+        while self._cursor_samples < target:
             try:
-                chunk = self.chunks.next()
+                chunk, audio = self._next_decoded()
             except StopIteration:
                 break
-            audio = read_codec(chunk["data"], codec="opus", sample_rate=self.sample_rate)
-            chunk_duration = timedelta(seconds=len(audio) / self.sample_rate)
-            diff = int(
-                (chunk["start"] - self.cursor).total_seconds()
-                * self.sample_rate
-            )
+            chunk_start = int((chunk["start"] - self._t0).total_seconds() * self.sample_rate)
+            chunk_end = chunk_start + len(audio)
+            diff = chunk_start - self._cursor_samples
 
             if diff > 0:
                 # gap between chunks, insert silence
@@ -236,13 +391,16 @@ class AudioChunkReader:
                     overlap = -diff
                     prev = result[-1]
                     result[-1] = prev[:overlap]
-                    result.append(np.mean([prev[overlap:], audio[:overlap]], axis=0))
+                    blended = np.add(prev[overlap:], audio[:overlap], dtype=np.float32)
+                    blended *= np.float32(0.5)
+                    result.append(blended)
                 audio = audio[-diff:]
 
             result.append(audio)
 
-            self.cursor = chunk["start"] + chunk_duration
+            self._cursor_samples = chunk_end
 
+        self.cursor = self._t0 + timedelta(seconds=self._cursor_samples / self.sample_rate)
 
         return np.concatenate(result, axis=0, dtype=np.float32)
 
@@ -262,36 +420,76 @@ def fetch_audio(
         fetch_batch_size=prefetch_chunks,
         sample_rate=sample_rate,
     )
-    result = reader.read(duration)
+    try:
+        result = reader.read(duration)
+    finally:
+        reader.close()
     return array_to_wav(result[:int(duration.total_seconds() * sample_rate)])
 
 
+def map_file(file) -> mmap.mmap | bytes:
+    """
+    Map a chunk file read-only so its body is base64-encoded straight from
+    the page cache instead of being copied into a Python bytes object first.
+    """
+    with open(file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def close_chunk_data(operations: list[dict]):
+    for op in operations:
+        data = op["insertOne"]["document"]["data"]
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def insert_chunks(operations: list[dict]):
+    try:
+        call_resource('tech.mycelia.mongo', {
+            "action": "bulkWrite",
+            "collection": "audio_chunks",
+            "operations": operations,
+            "options": {"ordered": False},
+        })
+    finally:
+        close_chunk_data(operations)
+
+
 def ingest_source(original: dict):
     path = original["path"]
     tmp_dir = get_tmp_dir(path)
-    try:
-        logger.info("splitting '%s' into chunks", path)
-        chunk_files = split_to_opus_chunks(path)
-        start: datetime = original["start"]
-        logger.info("ingesting %s chunks of '%s'",len(chunk_files), path)
+    logger.info("splitting '%s' into chunks", path)
+    chunk_files = split_to_opus_chunks(path)
+    start: datetime = original["start"]
+    logger.info("ingesting %s chunks of '%s'",len(chunk_files), path)
 
+    operations = []
+    try:
         for i, [offset, file] in tqdm(enumerate(chunk_files)):
-            with open(file, "rb") as f:
-                call_resource('tech.mycelia.mongo', {
-                    "action": "insertOne",
-                    "collection": "audio_chunks",
-                    "doc": {
-                        "format": "opus",
-                        "original_id": original["_id"],
-                        "index": i,
-                        "ingested_at": {
-                            "$date": datetime.now(tz=UTC).isoformat()
-                        },
-                        "start": start + offset,
-                        "data": {
-                            "$binary": { "base64": base64.b64encode(f.read()).decode(), "subType": "00"}
-                        },
-                    }
-                })
+            operations.append({"insertOne": {"document": {
+                "format": "opus",
+                "original_id": original["_id"],
+                "index": i,
+                "ingested_at": {
+                    "$date": datetime.now(tz=UTC).isoformat()
+                },
+                "start": start + offset,
+                # mapped bytes are sent as a subType 00 $binary by EJsonEncoder
+                "data": map_file(file),
+            }}})
+            if len(operations) >= INGEST_BATCH_SIZE:
+                batch, operations = operations, []
+                insert_chunks(batch)
+        if operations:
+            batch, operations = operations, []
+            insert_chunks(batch)
     finally:
-        shutil.rmtree(tmp_dir)
\ No newline at end of file
+        # maps of a batch that never reached insert_chunks, e.g. when a
+        # later map_file call raised
+        close_chunk_data(operations)
+
+    # only a fully uploaded source drops its split; after a failure the
+    # fingerprinted chunks are kept so the retry skips ffmpeg
+    shutil.rmtree(tmp_dir)
@@ -1,10 +1,11 @@
 # %%
 from datetime import datetime, timedelta
+import re
 
 import pytz
 
 from lib.resources import call_resource
-from lib.transcription import known_errors, remove_if_lonely
+from lib.transcription import TRANSCRIPT_INDEX, ensure_transcript_index, known_errors, remove_if_lonely
 
 
 # %%
@@ -12,118 +13,162 @@ end_date = datetime.now(pytz.UTC)
 start_date = end_date - timedelta(days=3000)
 
     
-pipeline = [
-    {
-        "$match": {
-            "start": {
-                "$gte": start_date,
-                "$lt": end_date,
+KNOWN_ERRORS = list(known_errors)
+REMOVE_IF_LONELY = list(remove_if_lonely)
+
+# Any segment that could be dropped: a known error, an *action* or a lonely
+# phrase (surrounding whitespace is trimmed by the filters below)
+CANDIDATE_SEGMENT_RE = r"^\s*(?:" + "|".join(
+    re.escape(text) for text in sorted(known_errors | remove_if_lonely)
+) + r"|\*.*\*)\s*$"
+
+ensure_transcript_index()
+
+def build_pipeline(window_start: datetime, window_end: datetime) -> list[dict]:
+    return [
+        {
+            "$match": {
+                "start": {
+                    "$gte": window_start,
+                    "$lt": window_end,
+                },
+                # Transcripts without a single candidate segment are left as is
+                "$or": [
+                    {"segments.text": {"$regex": CANDIDATE_SEGMENT_RE}},
+                    {"segments": {"$size": 0}},
+                    {"segments": None},
+                ],
             }
-        }
-    },
-    {
-        "$addFields": {
-            "cleanedSegments": {
-                "$filter": {
-                    "input": {"$ifNull": ["$segments", []]},
-                    "as": "seg",
-                    "cond": {
-                        "$and": [
-                            {
-                                "$not": {
-                                    "$in": [
-                                        {"$trim": {"input": "$$seg.text"}},
-                                        list(known_errors)
-                                    ]
+        },
+        {
+            # Single pass: the cleaned segments are bound once and every count
+            # is derived from that binding instead of chaining $addFields stages
+            "$addFields": {
+                "_c": {
+                    "$let": {
+                        "vars": {
+                            "clean": {
+                                "$filter": {
+                                    "input": {"$ifNull": ["$segments", []]},
+                                    "as": "seg",
+                                    "cond": {
+                                        "$and": [
+                                            {
+                                                "$not": {
+                                                    "$in": [
+                                                        {"$trim": {"input": "$$seg.text"}},
+                                                        KNOWN_ERRORS
+                                                    ]
+                                                }
+                                            },
+                                            {
+                                                "$not": {
+                                                    "$regexMatch": {
+                                                        "input": {"$trim": {"input": "$$seg.text"}},
+                                                        "regex": r"^\*.*\*$"
+                                                    }
+                                                }
+                                            }
+                                        ]
+                                    }
                                 }
                             },
-                            {
-                                "$not": {
-                                    "$regexMatch": {
-                                        "input": {"$trim": {"input": "$$seg.text"}},
-                                        "regex": r"^\*.*\*$"
+                        },
+                        "in": {
+                            "cleanedSegments": "$$clean",
+                            "keepableCount": {
+                                "$size": {
+                                    "$filter": {
+                                        "input": "$$clean",
+                                        "as": "seg",
+                                        "cond": {
+                                            "$not": {
+                                                "$in": [
+                                                    {"$trim": {"input": "$$seg.text"}},
+                                                    REMOVE_IF_LONELY
+                                                ]
+                                            }
+                                        }
                                     }
                                 }
-                            }
-                        ]
-                    }
-                }
+                            },
+                            "originalSegmentCount": {"$size": {"$ifNull": ["$segments", []]}},
+                            "cleanedSegmentCount": {"$size": "$$clean"},
+                        },
+                    },
+                },
             },
         },
-    },
-    {
-        "$addFields": {
-            "keepableSegments": {
-                "$filter": {
-                    "input": "$cleanedSegments",
-                    "as": "seg",
-                    "cond": {
-                        "$not": {
-                            "$in": [
-                                {"$trim": {"input": "$$seg.text"}},
-                                list(remove_if_lonely)
-                            ]
-                        }
-                    }
+        {
+            "$addFields": {
+                "shouldDelete": {"$eq": ["$_c.keepableCount", 0]},
+                "needsUpdate": {
+                    "$and": [
+                        {"$ne": ["$_c.originalSegmentCount", "$_c.cleanedSegmentCount"]},
+                        {"$ne": ["$_c.keepableCount", 0]},
+                    ]
                 },
-            },
+            }
         },
-    },
-    {
-        "$addFields": {
-            "keepableCount": {"$size": "$keepableSegments"},
-            "originalSegmentCount": {"$size": {"$ifNull": ["$segments", []]}},
-            "cleanedSegmentCount": {"$size": "$cleanedSegments"},
+        {
+            "$match": {
+                "$or": [
+                    {"shouldDelete": {"$eq": True}},
+                    {"needsUpdate": {"$eq": True}}
+                ]
+            }
         },
-    },
-    {
-        "$addFields": {
-            "shouldDelete": {"$eq": ["$keepableCount", 0]},
+        {
+            "$project": {
+                "_id": 1,
+                "originalSegmentCount": "$_c.originalSegmentCount",
+                "cleanedSegmentCount": "$_c.cleanedSegmentCount",
+                # Deletes only need the _id, so don't ship their segments back
+                "cleanedSegments": {
+                    "$cond": [{"$eq": ["$shouldDelete", True]}, "$$REMOVE", "$_c.cleanedSegments"]
+                },
+                "needsUpdate": 1,
+                "shouldDelete": 1,
+            }
         },
-    },
-    {
-        "$addFields": {
-            "needsUpdate": {
-                "$and": [
-                    {"$ne": [{"$size": {"$ifNull": ["$segments", []]}}, {"$size": "$cleanedSegments"}]},
-                    {"shouldDelete": False}
-                ]
-            },
-        }
-    },
-    {
-        "$match": {
-            "$or": [
-                {"shouldDelete": {"$eq": True}},
-                {"needsUpdate": {"$eq": True}}
-            ]
-        }
-    },
-    {
-        "$project": {
-            "_id": 1,
-            "originalSegmentCount": 1,
-            "cleanedSegmentCount": 1,
-            "cleanedSegments": 1,
-            "needsUpdate": 1,
-            "shouldDelete": 1,
-        }
-    },
-]
-
-results = call_resource(
-    "tech.mycelia.mongo",
-    {
-        "action": "aggregate",
-        "collection": "transcriptions",
-        "pipeline": pipeline,
-    }
-)
-
-len(results)
+    ]
+
+
+# Aggregate one time window at a time so only a window's results are ever
+# held in memory, flushing writes as they accumulate
+WINDOW = timedelta(days=30)
+FLUSH_EVERY = 500
+
+
+def iterate_results():
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + WINDOW, end_date)
+        yield from call_resource(
+            "tech.mycelia.mongo",
+            {
+                "action": "aggregate",
+                "collection": "transcriptions",
+                "pipeline": build_pipeline(window_start, window_end),
+                "options": {"hint": TRANSCRIPT_INDEX, "allowDiskUse": True},
+            }
+        )
+        window_start = window_end
+
+
+def flush(operations: list[dict]):
+    if operations:
+        call_resource(
+            "tech.mycelia.mongo",
+            {
+                "action": "bulkWrite",
+                "collection": "transcriptions",
+                "operations": operations,
+                "options": {"ordered": False}
+            }
+        )
 
 
-#%%
 #%%
 from collections import Counter
 
@@ -135,19 +180,16 @@ def get_verdict(result: dict) -> str:
 
     return "update"
 
-counter = Counter(get_verdict(result) for result in results)
-counter.most_common()
-
 #%%
 
-
-
+counter = Counter()
 bulk_operations = []
 deleted_count = 0
 updated_count = 0
 total_segments_removed = 0
 
-for result in results:
+for result in iterate_results():
+    counter[get_verdict(result)] += 1
     segments_removed = (
         result["originalSegmentCount"] - result["cleanedSegmentCount"] 
         if result["needsUpdate"] else 
@@ -170,25 +212,18 @@ for result in results:
             }
         })
         updated_count += 1
+
+    if len(bulk_operations) >= FLUSH_EVERY:
+        flush(bulk_operations)
+        bulk_operations = []
+
+flush(bulk_operations)
+counter.most_common()
 #%%
-print(f"  Total transcripts processed: {len(bulk_operations)}")
+print(f"  Total transcripts processed: {deleted_count + updated_count}")
 print(f"  Deleted transcripts: {deleted_count}")
 print(f"  Updated transcripts: {updated_count}")
 print(f"  Total segments removed: {total_segments_removed}")
 #%%
 
-if bulk_operations:
-    call_resource(
-        "tech.mycelia.mongo",
-        {
-            "action": "bulkWrite",
-            "collection": "transcriptions",
-            "operations": bulk_operations,
-            "options": {"ordered": False}
-        }
-    )
-
-
-#%%
-
 # %%
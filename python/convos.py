@@ -6,35 +6,62 @@ This script processes transcripts to extract conversations using LLM analysis.
 """
 
 import argparse
+import bisect
 import logging
+import logging.handlers
 import os
+import queue
 import signal
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional
 
-import pytz
+import orjson
 import yaml
+from bson import ObjectId
 from langchain_core.messages import HumanMessage, SystemMessage
-from pydantic import BaseModel, Field
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 
-import json
 import re
 
 from lib.resources import call_resource
 from lib.llm import get_llm
+from lib.llm_cache import ResponseCache
+from lib.transcription import ensure_transcript_index
 from lib.hist import mark_buckets_as, get_ranges, date_to_bucket, SCALE_TO_RESOLUTION
 
 
-# Signal handling for graceful shutdown
-signal.signal(signal.SIGINT, signal.SIG_DFL)
+# Signal handling for graceful shutdown: the first Ctrl-C stops submitting
+# new chunks and lets in-flight ones finish writing, a second one aborts
+_shutdown = threading.Event()
+
+def handle_sigint(signum, frame):
+    if _shutdown.is_set():
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        raise KeyboardInterrupt
+    _shutdown.set()
+    logger.warning("Interrupted, finishing in-flight chunks (press Ctrl-C again to abort)")
+
+signal.signal(signal.SIGINT, handle_sigint)
 
 # Setup logging
 logger = logging.getLogger('convos')
 
+UTC = timezone.utc
+
 
-def setup_logging():
-    """Setup logging configuration similar to daemon.py"""
+def setup_logging(debug: bool = False) -> logging.handlers.QueueListener:
+    """
+    Setup logging configuration similar to daemon.py. Records are written by
+    a background listener so workers never block on console or file I/O;
+    stop the returned listener on exit to flush them.
+    """
     log_dir = os.path.expanduser('~/Library/mycelia/logs')
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, 'convos.log')
@@ -43,31 +70,46 @@ def setup_logging():
     console.setLevel(logging.INFO)
 
     file_handler = logging.FileHandler(log_file)
-    file_handler.setLevel(logging.DEBUG)
+    file_handler.setLevel(logging.DEBUG if debug else logging.INFO)
 
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     console.setFormatter(formatter)
     file_handler.setFormatter(formatter)
 
-    logging.basicConfig(level=logging.DEBUG, handlers=[console, file_handler])
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    listener.start()
+
+    logging.basicConfig(
+        level=logging.DEBUG if debug else logging.INFO,
+        handlers=[logging.handlers.QueueHandler(log_queue)],
+    )
     logger.info(f"Logging to {log_file}")
+    return listener
 
 def utc(dt: datetime | int) -> datetime:
     """Convert datetime or timestamp to UTC timezone."""
     if isinstance(dt, int):
-        dt = datetime.fromtimestamp(dt)
+        return datetime.fromtimestamp(dt, tz=UTC)
     if dt.tzinfo is None:
-        return pytz.UTC.localize(dt)
-    return dt.astimezone(pytz.UTC)
+        return dt.replace(tzinfo=UTC)
+    # Dates decoded from Mongo already carry timezone.utc
+    return dt if dt.tzinfo is UTC else dt.astimezone(UTC)
+
+# Short chunks tolerate long pauses; the longer a chunk gets, the sooner
+# a pause ends it
+SHORT_CHUNK_GAP = timedelta(minutes=45)
+MEDIUM_CHUNK_GAP = timedelta(minutes=5)
+LONG_CHUNK_GAP = timedelta(seconds=40)
 
 def allowed_gap(length: int) -> timedelta:
     """Calculate allowed gap between transcripts based on content length."""
     if length < 500:
-        return timedelta(minutes=45)
+        return SHORT_CHUNK_GAP
     elif length < 20000:
-        return timedelta(minutes=5)
+        return MEDIUM_CHUNK_GAP
     else:
-        return timedelta(seconds=40)
+        return LONG_CHUNK_GAP
 
 def get_silence_message(gap: timedelta) -> str:
     """Generate silence message for gaps in conversation."""
@@ -75,13 +117,16 @@ def get_silence_message(gap: timedelta) -> str:
     s = gap.total_seconds() % 60
     return f'silence for {m:.0f}m {s:.0f}s'
 
+@lru_cache(maxsize=4096)
 def get_timestamp_message(timestamp: datetime) -> str:
     """Generate timestamp message for conversation chunks."""
     return f'time: {utc(timestamp).isoformat()}'
 
 scale = "1day"
 
-def iterate_transcripts(not_later_than: datetime | None = None, batch_size: int = 100):
+DEFAULT_TRANSCRIPT_BATCH_SIZE = 1000
+
+def iterate_transcripts(not_later_than: datetime | None = None, batch_size: int = DEFAULT_TRANSCRIPT_BATCH_SIZE):
     """
     Iterate through all transcripts in reverse chronological order.
     Yields one transcript at a time.
@@ -90,52 +135,119 @@ def iterate_transcripts(not_later_than: datetime | None = None, batch_size: int
         r for r in get_ranges("conversations", scale) if r.done
     ]
 
-    def shift_if_in_known_range(cursor: datetime) -> datetime:
-        for range in known_ranges:
-            if range.start is not None and range.end is not None:
-                if range.start <= cursor <= range.end:
-                    return range.start
-        return cursor
-
-    cursor = not_later_than or datetime.now(pytz.UTC) + timedelta(days=1)
-
-    while cursor:
-        cursor = shift_if_in_known_range(cursor)
-
-        transcripts = call_resource(
-            "tech.mycelia.mongo",
-            {
-                "action": "find",
-                "collection": "transcriptions",
-                "query": {"start": {"$lt": cursor}},
-                "options": {
-                    "sort": {"start": -1},
-                    "limit": batch_size,
-                },
-            }
-        )
-        logger.debug(f"Fetched {len(transcripts)} transcripts")
-
-        if len(transcripts) < 2:
-            return
-
-        # Handle edge case where last few transcripts have same timestamp
-        while len(transcripts) >= 2 and transcripts[-1]["start"] == transcripts[-2]["start"]:
-            transcripts = transcripts[:-1]
-
-        if len(transcripts) < 2:
-            return
+    # Done ranges are excluded by Mongo so their transcripts are never scanned
+    # or downloaded; get_ranges already returns them merged and disjoint.
+    # Sorted by start so each query only carries the ranges below its cursor
+    done_ranges = sorted(
+        (r for r in known_ranges if r.start is not None and r.end is not None),
+        key=lambda r: r.start,
+    )
+    done_starts = [r.start for r in done_ranges]
+    skip_done = [
+        {"start": {"$gte": r.start, "$lte": r.end}}
+        for r in done_ranges
+    ]
 
-        cursor = transcripts[-1]["start"]
+    ensure_transcript_index()
+
+    # Segment text is concatenated by Mongo so only one string per
+    # transcript crosses the wire instead of the whole segments array
+    projection = {
+        "start": 1,
+        "end": 1,
+        "text": {"$trim": {"input": {"$reduce": {
+            "input": {"$ifNull": ["$segments", []]},
+            "initialValue": "",
+            "in": {"$concat": ["$$value", {"$ifNull": ["$$this.text", ""]}]},
+        }}}},
+    }
 
-        for transcript in transcripts:
-            yield {
-                'start': transcript["start"],
-                'end': transcript["end"],
-                'text': ''.join(s["text"] for s in transcript["segments"]).strip(),
-            }
+    def open_cursor(cursor: datetime, last_id: ObjectId | None) -> dict:
+        # (start, _id) keyset: transcripts sharing a start are ordered by
+        # _id, so a reopened cursor never drops or repeats one
+        if last_id is None:
+            query = {"start": {"$lt": cursor}}
+        else:
+            query = {"$or": [
+                {"start": {"$lt": cursor}},
+                {"start": cursor, "_id": {"$lt": last_id}},
+            ]}
+        below_cursor = bisect.bisect_right(done_starts, cursor)
+        if below_cursor:
+            query["$nor"] = skip_done[:below_cursor]
+
+        return call_resource("tech.mycelia.mongo", {
+            "action": "getFirstBatch",
+            "collection": "transcriptions",
+            "query": query,
+            "options": {
+                "sort": {"start": -1, "_id": -1},
+                "projection": projection,
+            },
+            "batchSize": batch_size,
+        })
+
+    def get_more(cursor_id: str) -> dict:
+        return call_resource("tech.mycelia.mongo", {
+            "action": "getMore",
+            "collection": "transcriptions",
+            "cursorId": cursor_id,
+            "batchSize": batch_size,
+        })
+
+    cursor = not_later_than or datetime.now(UTC) + timedelta(days=1)
+    last_id = None
+
+    # One server-side cursor is streamed with getMore. The backend reports an
+    # expired cursor the same way as an exhausted one, so whenever it ends
+    # the query is reopened after the last (start, _id) seen and iteration
+    # only stops once a fresh query comes back empty. The next page is
+    # requested before the current one is yielded, so the round-trip
+    # overlaps with the caller grouping it
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        next_page = prefetcher.submit(open_cursor, cursor, last_id)
+        fresh = True
+        try:
+            while True:
+                page = next_page.result()
+                transcripts = page.get("data") or []
+                logger.debug(f"Fetched {len(transcripts)} transcripts")
+                if fresh and not transcripts:
+                    return
+
+                if fresh:
+                    cursor_id = page.get("cursorId")
+                if transcripts:
+                    cursor, last_id = transcripts[-1]["start"], transcripts[-1]["_id"]
+
+                if page.get("hasMore") and transcripts:
+                    next_page = prefetcher.submit(get_more, cursor_id)
+                    fresh = False
+                else:
+                    next_page = prefetcher.submit(open_cursor, cursor, last_id)
+                    fresh = True
+
+                for transcript in transcripts:
+                    yield {
+                        'start': transcript["start"],
+                        'end': transcript["end"],
+                        'text': transcript["text"],
+                    }
+        finally:
+            next_page.cancel()
+
+def earliest_transcript_start() -> Optional[datetime]:
+    """Start of the oldest transcript, the lower bound of what a run can reach."""
+    ensure_transcript_index()
+    oldest = call_resource("tech.mycelia.mongo", {
+        "action": "findOne",
+        "collection": "transcriptions",
+        "query": {},
+        "options": {"projection": {"_id": 0, "start": 1}, "sort": {"start": 1, "_id": 1}},
+    })
+    return utc(oldest["start"]) if oldest else None
 
-def iterate_conversations(not_later_than: datetime | None = None):
+def iterate_conversations(not_later_than: datetime | None = None, batch_size: int = DEFAULT_TRANSCRIPT_BATCH_SIZE):
     """
     Group transcripts into conversation chunks based on timing gaps.
     """
@@ -143,15 +255,18 @@ def iterate_conversations(not_later_than: datetime | None = None):
     total_len = 0
     last_timestamp = None
 
-    for transcript in iterate_transcripts(not_later_than):
+    for transcript in iterate_transcripts(not_later_than, batch_size):
         if not last_timestamp:
             last_timestamp = transcript["start"]
 
         gap = (last_timestamp - transcript["start"])
+        # Transcripts arrive newest first, so reversing a buffer sorts it
+        assert gap >= timedelta(0), "transcripts must be in descending start order"
 
         if buffer:
             if total_len > 100 and gap > allowed_gap(total_len):
-                yield sorted(buffer, key=lambda x: x["start"])
+                buffer.reverse()
+                yield buffer
                 buffer = []
                 total_len = 0
 
@@ -160,24 +275,31 @@ def iterate_conversations(not_later_than: datetime | None = None):
         last_timestamp = transcript["start"]
 
     if buffer:
-        yield sorted(buffer, key=lambda x: x["start"])
+        buffer.reverse()
+        yield buffer
 
 def chunk_to_prompt(chunk: list[dict]):
     """Convert conversation chunk to LLM prompt format."""
     earliest = chunk[0]["start"]
     latest = chunk[0]["end"]
-    strings = [get_timestamp_message(earliest)]
+    min_gap = timedelta(seconds=30)
+    timestamp_message = get_timestamp_message
+    strings = [timestamp_message(earliest)]
+    append = strings.append
 
     for c in chunk:
-        gap = (c["start"] - latest)
-        if gap > timedelta(seconds=30):
-            strings.append(get_timestamp_message(latest))
-            strings.append(get_silence_message(gap))
-            strings.append(get_timestamp_message(c["start"]))
-        strings.append(c["text"])
-        latest = max(latest, c["end"])
-
-    strings.append(get_timestamp_message(latest))
+        start = c["start"]
+        gap = start - latest
+        if gap > min_gap:
+            append(timestamp_message(latest))
+            append(get_silence_message(gap))
+            append(timestamp_message(start))
+        append(c["text"])
+        end = c["end"]
+        if end > latest:
+            latest = end
+
+    append(timestamp_message(latest))
     return "\n".join(strings), earliest, latest
 
 class Conversation(BaseModel):
@@ -188,32 +310,55 @@ class Conversation(BaseModel):
     start: datetime = Field(description="ISO 8601 timestamp when conversation started")
     end: datetime = Field(description="ISO 8601 timestamp when conversation ended")
     emoji: str = Field(description="Single emoji representing the conversation")
+    chunk_index: Optional[int] = Field(default=None, description="Number N of the '### CHUNK N' section the conversation was found in, when the transcript has such sections")
 
 class ExtractConversationsInput(BaseModel):
     """Input model for conversation extraction."""
     conversations: List[Conversation] = Field(description="List of conversations extracted from the transcript")
 
-def setup_llm_tools(model: str = "small"):
-    """Setup LLM tools and prompts for conversation extraction."""
-    extract_conversations_tool = {
-        "name": "extract_conversations",
-        "description": "Extract and return the conversations from the transcript",
-        "parameters": ExtractConversationsInput.model_json_schema()
-    }
+CONVERSATION_LIST = TypeAdapter(List[Conversation])
 
-    llm = get_llm(model)
-    tool_llm = llm.bind_tools([extract_conversations_tool], tool_choice={
-        "type": "function",
-        "function": {"name": "extract_conversations"}
-    })
+DEFAULT_WORKERS = 4
+# Part of the response cache key; bump when the prompt format or the
+# parsing of tool calls changes in a way that invalidates old responses
+PROMPT_VERSION = "v1"
+DEFAULT_REQUESTS_PER_MINUTE = 60
+LLM_MAX_RETRIES = 6
+
+EXTRACT_CONVERSATIONS_TOOL = {
+    "name": "extract_conversations",
+    "description": "Extract and return the conversations from the transcript",
+    "parameters": ExtractConversationsInput.model_json_schema()
+}
 
+@lru_cache(maxsize=None)
+def load_prompts() -> dict:
     prompts_path = Path(__file__).parent / "prompts.yml"
     with open(prompts_path, "r") as f:
-        prompts = yaml.safe_load(f)
+        return yaml.safe_load(f)
 
-    system_prompt = prompts["topics"]["system"]
+@lru_cache(maxsize=3)
+def setup_llm_tools(model: str = "small", requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE):
+    """
+    Setup LLM tools and prompts for conversation extraction. Cached, so
+    repeated runs in one process reuse the client and its rate limiter.
+    """
+    # Shared token bucket across worker threads; rate-limit errors are
+    # retried by the OpenAI client with exponential backoff
+    rate_limiter = InMemoryRateLimiter(
+        requests_per_second=requests_per_minute / 60,
+        check_every_n_seconds=0.1,
+        max_bucket_size=max(1, requests_per_minute // 60),
+    )
+    llm = get_llm(model, rate_limiter=rate_limiter, max_retries=LLM_MAX_RETRIES)
+    tool_llm = llm.bind_tools([EXTRACT_CONVERSATIONS_TOOL], tool_choice={
+        "type": "function",
+        "function": {"name": "extract_conversations"}
+    })
 
-    return tool_llm, system_prompt
+    system_message = SystemMessage(content=load_prompts()["topics"]["system"])
+
+    return tool_llm, system_message
 
 def create_conversation_object(conv, conv_start, conv_end, now, model: str = "small"):
     """Create a conversation object from extracted conversation data"""
@@ -257,42 +402,124 @@ def create_mentioned_relationship(entity_id, conversation_id, entity_name, conve
         'updatedAt': now,
     }
 
-def find_or_create_entity(entity_name, now):
-    """Find existing entity or create new one"""
-    # Check if entity already exists
-    existing = call_resource("tech.mycelia.mongo", {
-        "action": "findOne",
-        "collection": "objects",
-        "query": {"name": entity_name}
-    })
+def inserted_id_list(result: dict) -> list:
+    """Return insertMany ids in insertion order; EJSON turns the index keys into strings."""
+    inserted_ids = result.get('insertedIds') or {}
+    if isinstance(inserted_ids, dict):
+        return [inserted_ids[k] for k in sorted(inserted_ids, key=int)]
+    return list(inserted_ids)
+
+# Chunks are processed concurrently; find-then-insert must not interleave
+# or two workers could create the same entity twice
+_entity_lock = threading.Lock()
+
+# The same people and places recur across chunks; entities are never deleted
+# here, so a resolved name -> _id mapping stays valid for the whole run
+ENTITY_CACHE_SIZE = 50_000
+_entity_cache: OrderedDict = OrderedDict()
+
+def bulk_resolve_entities(entity_names, now) -> dict:
+    """Map entity names to object IDs with one find and one insertMany for the missing ones."""
+    names = list(dict.fromkeys(entity_names))
+    if not names:
+        return {}
+
+    with _entity_lock:
+        entity_ids = {}
+        for name in names:
+            if name in _entity_cache:
+                _entity_cache.move_to_end(name)
+                entity_ids[name] = _entity_cache[name]
+
+        unresolved = [name for name in names if name not in entity_ids]
+        if unresolved:
+            existing = call_resource("tech.mycelia.mongo", {
+                "action": "find",
+                "collection": "objects",
+                "query": {"name": {"$in": unresolved}},
+                "options": {"projection": {"_id": 1, "name": 1}},
+            })
+            for doc in existing:
+                entity_ids.setdefault(doc['name'], doc['_id'])
+
+            missing = [name for name in unresolved if name not in entity_ids]
+            if missing:
+                entity_ids.update(upsert_entities(missing, now))
 
-    if existing:
-        return existing['_id']
+            for name in unresolved:
+                if name in entity_ids:
+                    _entity_cache[name] = entity_ids[name]
+            while len(_entity_cache) > ENTITY_CACHE_SIZE:
+                _entity_cache.popitem(last=False)
 
-    # Create new entity
-    entity_obj = create_entity_object(entity_name, now)
+    return entity_ids
+
+def upsert_entities(names: list[str], now) -> dict:
+    """
+    Create entities with one unordered bulk upsert. $setOnInsert keeps this
+    safe against another process creating the same name in the meantime,
+    in which case the existing id is looked up instead.
+    """
     result = call_resource("tech.mycelia.mongo", {
-        "action": "insertOne",
+        "action": "bulkWrite",
         "collection": "objects",
-        "doc": entity_obj
+        "operations": [
+            {
+                "updateOne": {
+                    "filter": {"name": name},
+                    "update": {"$setOnInsert": create_entity_object(name, now)},
+                    "upsert": True,
+                }
+            }
+            for name in names
+        ],
+        "options": {"ordered": False},
     })
-    return result['insertedId']
+    upserted = result.get("upsertedIds") or {}
+    entity_ids = {names[int(i)]: _id for i, _id in upserted.items()}
+
+    raced = [name for name in names if name not in entity_ids]
+    if raced:
+        for doc in call_resource("tech.mycelia.mongo", {
+            "action": "find",
+            "collection": "objects",
+            "query": {"name": {"$in": raced}},
+            "options": {"projection": {"_id": 1, "name": 1}},
+        }):
+            entity_ids.setdefault(doc["name"], doc["_id"])
+
+    return entity_ids
+
+def find_or_create_entity(entity_name, now):
+    """Find existing entity or create new one"""
+    return bulk_resolve_entities([entity_name], now).get(entity_name)
+
+def ranges_with_conversations(ranges: list[tuple[datetime, datetime]]) -> list[bool]:
+    """Check several time ranges for existing conversations with a single query."""
+    if not ranges:
+        return []
 
-def check_conversations_exist(start: datetime, end: datetime) -> bool:
-    """Check if conversations already exist for this time range."""
     existing = call_resource("tech.mycelia.mongo", {
-        "action": "findOne",
+        "action": "find",
         "collection": "objects",
         "query": {
-            "timeRanges": {
-                "$elemMatch": {
-                    "start": {"$lt": end},
-                    "end": {"$gt": start}
-                }
-            }
-        }
+            "$or": [
+                {"timeRanges": {"$elemMatch": {"start": {"$lt": end}, "end": {"$gt": start}}}}
+                for start, end in ranges
+            ]
+        },
+        "options": {"projection": {"_id": 0, "timeRanges": 1}},
     })
-    return existing is not None
+    time_ranges = [tr for doc in existing for tr in doc.get("timeRanges", [])]
+
+    return [
+        any(utc(tr["start"]) < end and utc(tr["end"]) > start for tr in time_ranges)
+        for start, end in ranges
+    ]
+
+def check_conversations_exist(start: datetime, end: datetime) -> bool:
+    """Check if conversations already exist for this time range."""
+    return ranges_with_conversations([(start, end)])[0]
 
 def delete_conversations_in_range(start: datetime, end: datetime) -> int:
     """Delete existing conversations and their relationships in a time range."""
@@ -306,13 +533,16 @@ def delete_conversations_in_range(start: datetime, end: datetime) -> int:
                     "end": {"$gt": start}
                 }
             }
-        }
+        },
+        "options": {"projection": {"_id": 1}},
     })
 
-    if not conversations:
-        return 0
+    return delete_conversations([conv['_id'] for conv in conversations])
 
-    conversation_ids = [conv['_id'] for conv in conversations]
+def delete_conversations(conversation_ids: list) -> int:
+    """Delete conversations and their relationships by id."""
+    if not conversation_ids:
+        return 0
 
     call_resource("tech.mycelia.mongo", {
         "action": "deleteMany",
@@ -332,299 +562,620 @@ def delete_conversations_in_range(start: datetime, end: datetime) -> int:
     logger.info(f"Deleted {len(conversation_ids)} existing conversations and their relationships")
     return len(conversation_ids)
 
-def process_conversation_chunk(chunk, tool_llm, system_prompt, model: str = "small", force: bool = False):
-    """Process a single conversation chunk and extract conversations."""
-    prompt, chunk_start, chunk_end = chunk_to_prompt(chunk)
-
-    dur = int((chunk_end - chunk_start).total_seconds())
-    hours = dur // 3600
-    minutes = (dur % 3600) // 60
-    seconds = (dur % 60)
-    dur_str = f'{hours}h {minutes}m {seconds}s' if hours else f'{minutes}m {seconds}s'
+class ConversationIndex:
+    """
+    In-memory snapshot of the time ranges of existing objects, loaded once
+    per run so chunks are checked for existing conversations without a query.
+    Force mode only records what to replace, once the replacement has been
+    stored; the deletes are issued together by `flush_deletes`, and only
+    touch objects that existed before the run.
+    """
 
-    logger.info(f"Processing chunk: {chunk_start.strftime('%Y-%m-%d %H:%M')} -> {chunk_end.strftime('%Y-%m-%d %H:%M')}")
-    logger.info(f"Duration: {dur_str}, Length: {len(prompt)} chars")
+    def __init__(self, not_later_than: datetime, not_earlier_than: Optional[datetime] = None):
+        # Only ranges inside the span the run's transcripts cover can block a chunk
+        window = {"start": {"$lt": not_later_than}}
+        if not_earlier_than is not None:
+            window["end"] = {"$gt": not_earlier_than}
+        existing = call_resource("tech.mycelia.mongo", {
+            "action": "find",
+            "collection": "objects",
+            "query": {"timeRanges": {"$elemMatch": window}},
+            "options": {"projection": {"_id": 1, "timeRanges": 1}},
+        })
+        lower = utc(not_earlier_than) if not_earlier_than is not None else None
+        upper = utc(not_later_than)
+        entries = sorted(
+            (start, end, doc["_id"])
+            for doc in existing
+            for tr in doc.get("timeRanges", [])
+            for start, end in [(utc(tr["start"]), utc(tr["end"]))]
+            if start < upper and (lower is None or end > lower)
+        )
 
-    if not force and check_conversations_exist(chunk_start, chunk_end):
-        logger.info("Conversations already exist for this time range, skipping (use --force to recreate)")
-        return -1
+        # Ranges are bucketed by length class (powers of two seconds) and each
+        # class bounds its own bisect window, so one long-lived object can't
+        # make every lookup scan back over the whole snapshot
+        classes = {}
+        for entry in entries:
+            start, end, _ = entry
+            length_class = max(int((end - start).total_seconds()), 0).bit_length()
+            classes.setdefault(length_class, []).append(entry)
+        self.classes = [
+            (
+                [start for start, _, _ in class_entries],
+                class_entries,
+                max(end - start for start, end, _ in class_entries),
+            )
+            for class_entries in classes.values()
+        ]
+        self.to_delete = set()
+        self.lock = threading.Lock()
+        logger.info(f"Loaded {len(entries)} existing time ranges")
+
+    def overlapping(self, start: datetime, end: datetime) -> set:
+        """Ids of objects with a time range overlapping [start, end)."""
+        ids = set()
+        for starts, class_entries, longest in self.classes:
+            lo = bisect.bisect_left(starts, start - longest)
+            hi = bisect.bisect_left(starts, end)
+            ids.update(_id for s, e, _id in class_entries[lo:hi] if e > start)
+        return ids
+
+    def exists(self, start: datetime, end: datetime) -> bool:
+        return bool(self.overlapping(start, end))
+
+    def replace(self, ids: set):
+        """Queue objects for deletion; call once whatever replaces them is stored."""
+        with self.lock:
+            self.to_delete |= ids
+
+    def flush_deletes(self) -> int:
+        with self.lock:
+            ids, self.to_delete = list(self.to_delete), set()
+        return delete_conversations(ids)
+
+# Small chunks are sent to the LLM together; ~4 chars per token keeps a
+# group's prompt around 6k tokens
+MAX_GROUP_PROMPT_CHARS = 24000
+MAX_GROUP_SIZE = 8
+
+# Chunks this short hardly ever hold a conversation and are not worth an LLM call
+MIN_CHUNK_CHARS = 300
+MIN_SINGLE_TRANSCRIPT_CHARS = 1000
+
+def chunk_text_length(chunk: list[dict]) -> int:
+    return sum(len(c["text"]) for c in chunk)
+
+def is_trivial_chunk(chunk: list[dict]) -> bool:
+    content_len = chunk_text_length(chunk)
+    return content_len < MIN_CHUNK_CHARS or (len(chunk) == 1 and content_len < MIN_SINGLE_TRANSCRIPT_CHARS)
+
+def marshal_chunks(chunks, max_prompt_chars: int = MAX_GROUP_PROMPT_CHARS, max_group_size: int = MAX_GROUP_SIZE):
+    """
+    Group consecutive conversation chunks so several small ones share a
+    single LLM call. A chunk larger than `max_prompt_chars` forms its own group.
+    """
+    group = []
+    group_len = 0
+    for chunk in chunks:
+        length = chunk_text_length(chunk)
+        if group and (group_len + length > max_prompt_chars or len(group) >= max_group_size):
+            yield group
+            group = []
+            group_len = 0
+        group.append(chunk)
+        group_len += length
+    if group:
+        yield group
+
+def conversations_from_tool_args(args: dict) -> list[Conversation]:
+    """
+    Validate tool call arguments. The model doesn't always follow the tool
+    schema (a string index, a bare string for entities), so every conversation
+    goes through pydantic and the ones that don't fit are dropped.
+    """
+    candidates = args.get("conversations") if isinstance(args, dict) else None
+    if not isinstance(candidates, list):
+        logger.warning(f"Tool call arguments carry no conversation list: {str(args)[:200]}")
+        return []
+    return validate_conversations(candidates)
+
+def validate_conversations(candidates: list[dict]) -> list[Conversation]:
+    """Validate parsed conversation dicts in one pass, dropping the ones that don't fit."""
+    try:
+        return CONVERSATION_LIST.validate_python(candidates)
+    except ValidationError:
+        pass
 
-    if force:
-        deleted_count = delete_conversations_in_range(chunk_start, chunk_end)
-        if deleted_count > 0:
-            logger.info(f"Force mode: recreating conversations for this time range")
+    conversations = []
+    for candidate in candidates:
+        try:
+            conversations.append(Conversation.model_validate(candidate))
+        except ValidationError as e:
+            logger.debug(f"Failed to parse conversation: {e}")
+    return conversations
+
+# Fallback parsing of free-form responses
+MARKDOWN_SECTION_RE = re.compile(r'^## ', re.MULTILINE)
+ISO_TIMESTAMP_RE = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})')
+TIME_RANGE_RE = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})\s+to\s+[~]?(\d{2}:\d{2}:\d{2}|\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})')
+ENTITY_LINE_RE = re.compile(r'^[-*]\s+(?:People|Topics|Actions|Distance|Time|Activities|Location|Locations mentioned):\s*(.+)')
+FIELD_TAG_RE = re.compile(r'\*\*(Start|End|Title|Time|Summary|Key Entities):\*\*')
+
+def parse_conversations(response, chunk_start: datetime, chunk_end: datetime, model: str = "small") -> list[Conversation]:
+    """Extract conversations from an LLM response, falling back to JSON and markdown parsing."""
+    extracted_conversations = []
+    if response.tool_calls and len(response.tool_calls) > 0:
+        tool_call = response.tool_calls[0]
+        extracted_conversations = conversations_from_tool_args(tool_call["args"])
+        logger.info(f"Found {len(extracted_conversations)} conversations from tool_calls")
+    else:
+        logger.error(f"No tool_calls returned from LLM despite tool_choice='extract_conversations'")
+        logger.error(f"Response type: {type(response).__name__}, has content: {hasattr(response, 'content')}")
 
-    try:
-        response = tool_llm.invoke([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=prompt)
-        ])
-
-        extracted_conversations = []
-        if response.tool_calls and len(response.tool_calls) > 0:
-            tool_call = response.tool_calls[0]
-            extracted_conversations = ExtractConversationsInput.model_validate(tool_call["args"]).conversations
-            logger.info(f"Found {len(extracted_conversations)} conversations from tool_calls")
-        else:
-            logger.error(f"No tool_calls returned from LLM despite tool_choice='extract_conversations'")
-            logger.error(f"Response type: {type(response).__name__}, has content: {hasattr(response, 'content')}")
+        if hasattr(response, 'content') and response.content:
+            logger.debug(f"Response content length: {len(response.content)} chars")
+            logger.debug(f"Response content preview (first 500 chars):\n{response.content[:500]}")
+            logger.warning("Attempting to parse conversations from response content as fallback")
+            try:
+                # Same span as a greedy r'\[.*\]' match: first '[' to last ']'
+                array_start = response.content.find('[')
+                array_end = response.content.rfind(']')
+                if array_start != -1 and array_end > array_start:
+                    json_data = orjson.loads(response.content[array_start:array_end + 1])
+                    candidates = []
+                    for conv_dict in json_data:
+                        try:
+                            start_time = conv_dict.get("start_time") or conv_dict.get("start") or datetime.now(UTC).isoformat()
+                            end_time = conv_dict.get("end_time") or conv_dict.get("end") or datetime.now(UTC).isoformat()
+                            entities = conv_dict.get("entities", [])
+                            if not entities:
+                                people = conv_dict.get("people", [])
+                                places = conv_dict.get("places", [])
+                                things = conv_dict.get("things", [])
+                                entities = people + places + things
+                            if entities and isinstance(entities[0], dict):
+                                entities = [e.get("name", e.get("text", str(e))) for e in entities]
+                            candidates.append({
+                                "title": conv_dict.get("title", ""),
+                                "summary": conv_dict.get("summary", ""),
+                                "entities": entities,
+                                "start": start_time,
+                                "end": end_time,
+                                "emoji": conv_dict.get("emoji", "💬"),
+                            })
+                        except Exception as e:
+                            logger.debug("Failed to parse conversation: %s", e)
+                    extracted_conversations = validate_conversations(candidates)
+                    if extracted_conversations:
+                        logger.info(f"Parsed {len(extracted_conversations)} conversations from JSON")
+            except Exception as e:
+                logger.debug(f"Failed to parse JSON from content: {e}")
+
+    if not extracted_conversations:
+        logger.warning("Attempting to parse conversations from markdown format as fallback")
+        try:
+            sections = MARKDOWN_SECTION_RE.split(response.content)
+            candidates = []
+            logger.debug(f"Found {len(sections)} markdown sections (including header)")
 
-            if hasattr(response, 'content') and response.content:
-                logger.debug(f"Response content length: {len(response.content)} chars")
-                logger.debug(f"Response content preview (first 500 chars):\n{response.content[:500]}")
-                logger.warning("Attempting to parse conversations from response content as fallback")
+            for idx, section in enumerate(sections[1:], 1):
                 try:
-                    json_match = re.search(r'\[.*\]', response.content, re.DOTALL)
-                    if json_match:
-                        json_data = json.loads(json_match.group(0))
-                        for conv_dict in json_data:
-                            try:
-                                start_time = conv_dict.get("start_time") or conv_dict.get("start") or datetime.now(pytz.UTC).isoformat()
-                                end_time = conv_dict.get("end_time") or conv_dict.get("end") or datetime.now(pytz.UTC).isoformat()
-                                entities = conv_dict.get("entities", [])
-                                if not entities:
-                                    people = conv_dict.get("people", [])
-                                    places = conv_dict.get("places", [])
-                                    things = conv_dict.get("things", [])
-                                    entities = people + places + things
-                                if entities and isinstance(entities[0], dict):
-                                    entities = [e.get("name", e.get("text", str(e))) for e in entities]
-                                extracted_conversations.append(Conversation(
-                                    title=conv_dict.get("title", ""),
-                                    summary=conv_dict.get("summary", ""),
-                                    entities=entities,
-                                    start=start_time,
-                                    end=end_time,
-                                    emoji=conv_dict.get("emoji", "💬")
-                                ))
-                            except Exception as e:
-                                logger.debug(f"Failed to parse conversation: {e}")
-                        if extracted_conversations:
-                            logger.info(f"Parsed {len(extracted_conversations)} conversations from JSON")
-                except Exception as e:
-                    logger.debug(f"Failed to parse JSON from content: {e}")
-
-        if not extracted_conversations:
-            logger.warning("Attempting to parse conversations from markdown format as fallback")
-            try:
-                sections = re.split(r'^## ', response.content, flags=re.MULTILINE)
-                logger.debug(f"Found {len(sections)} markdown sections (including header)")
-
-                for idx, section in enumerate(sections[1:], 1):
-                    try:
-                        lines = section.strip().split('\n')
-                        section_title = lines[0].split(':')[0].strip() if lines else ""
-                        logger.debug(f"Section {idx} header: {section_title[:50]}...")
-
-                        title = None
-                        start_time = None
-                        end_time = None
-                        entities_list = []
-                        summary_text = ""
-                        in_entities = False
-                        in_summary = False
-
-                        for line in lines:
-                            stripped = line.strip()
-
-                            # Extract times first (check before other patterns)
-                            if '**Start:**' in line:
-                                start_match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})', line)
-                                if start_match:
-                                    start_time = start_match.group(1)
-                                    logger.debug(f"Extracted start time: {start_time}")
-                                else:
-                                    logger.debug(f"Found **Start:** but couldn't extract time from: {line[:100]}")
-                            elif '**End:**' in line:
-                                end_match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})', line)
-                                if end_match:
-                                    end_time = end_match.group(1)
-                                    logger.debug(f"Extracted end time: {end_time}")
+                    lines = section.strip().split('\n')
+                    section_title = lines[0].split(':')[0].strip() if lines else ""
+                    logger.debug("Section %d header: %.50s...", idx, section_title)
+
+                    title = None
+                    start_time = None
+                    end_time = None
+                    entities_list = []
+                    summary_text = ""
+                    in_entities = False
+                    in_summary = False
+
+                    for line in lines:
+                        stripped = line.strip()
+                        # One scan finds which field, if any, the line holds
+                        tag_match = FIELD_TAG_RE.search(line)
+                        tag = tag_match.group(1) if tag_match else None
+                        value = line[tag_match.end():].strip() if tag_match else ""
+
+                        # Extract times first (check before other patterns)
+                        if tag == 'Start':
+                            start_match = ISO_TIMESTAMP_RE.search(line)
+                            if start_match:
+                                start_time = start_match.group(1)
+                                logger.debug("Extracted start time: %s", start_time)
+                            else:
+                                logger.debug("Found **Start:** but couldn't extract time from: %.100s", line)
+                        elif tag == 'End':
+                            end_match = ISO_TIMESTAMP_RE.search(line)
+                            if end_match:
+                                end_time = end_match.group(1)
+                                logger.debug("Extracted end time: %s", end_time)
+                            else:
+                                logger.debug("Found **End:** but couldn't extract time from: %.100s", line)
+                        elif tag == 'Title':
+                            title = value
+                        elif tag == 'Time':
+                            time_match = TIME_RANGE_RE.search(value)
+                            if time_match:
+                                start_time = time_match.group(1)
+                                end_part = time_match.group(2)
+                                if 'T' in end_part:
+                                    end_time = end_part
                                 else:
-                                    logger.debug(f"Found **End:** but couldn't extract time from: {line[:100]}")
-                            elif '**Title:**' in line:
-                                title = line.split('**Title:**', 1)[1].strip()
-                            elif '**Time:**' in line:
-                                time_part = line.split('**Time:**', 1)[1].strip()
-                                time_match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})\s+to\s+[~]?(\d{2}:\d{2}:\d{2}|\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})', time_part)
-                                if time_match:
-                                    start_time = time_match.group(1)
-                                    end_part = time_match.group(2)
-                                    if 'T' in end_part:
-                                        end_time = end_part
-                                    else:
-                                        start_date = start_time.split('T')[0]
-                                        end_time = f"{start_date}T{end_part}"
-                            elif '**Summary:**' in line:
-                                in_summary = True
-                                in_entities = False
-                                summary_start = line.split('**Summary:**', 1)[1].strip()
-                                if summary_start:
-                                    summary_text = summary_start
-                            elif '**Key Entities:**' in line:
-                                in_entities = True
-                                in_summary = False
-                            elif in_summary and stripped and not stripped.startswith('**'):
-                                summary_text += " " + stripped
-                            elif in_entities and (stripped.startswith('-') or stripped.startswith('*')):
-                                entity_match = re.match(r'^[-*]\s+(?:People|Topics|Actions|Distance|Time|Activities|Location|Locations mentioned):\s*(.+)', stripped)
-                                if entity_match:
-                                    entity_text = entity_match.group(1)
-                                    entities = [e.strip() for e in entity_text.split(',')]
-                                    entities_list.extend(entities)
-
-                        if not title:
-                            title = section_title
-
-                        if title and (start_time or end_time):
-                            conv_start = start_time or chunk_start.isoformat()
-                            conv_end = end_time or chunk_end.isoformat()
-
-                            extracted_conversations.append(Conversation(
-                                title=title,
-                                summary=summary_text.strip() if summary_text else "No summary available",
-                                entities=entities_list[:10],
-                                start=conv_start,
-                                end=conv_end,
-                                emoji="💬"
-                            ))
-                            logger.debug(f"Extracted conversation: {title}")
-                        else:
-                            logger.debug(f"Skipped section - missing title or times. Title: {title}, Start: {start_time}, End: {end_time}")
-                    except Exception as md_e:
-                        logger.debug(f"Failed to parse markdown section {idx}: {md_e}", exc_info=True)
-                if extracted_conversations:
-                    logger.info(f"Parsed {len(extracted_conversations)} conversations from markdown")
-                else:
-                    logger.warning("Markdown parsing found 0 conversations")
-            except Exception as md_error:
-                logger.warning(f"Failed to parse markdown from content: {md_error}", exc_info=True)
-
-        if not extracted_conversations:
-            logger.error("No conversations found in chunk after all parsing attempts")
-            if hasattr(response, 'content') and response.content:
-                debug_file = os.path.expanduser('~/Library/mycelia/logs/llm_response_debug.txt')
-                try:
-                    with open(debug_file, 'w') as f:
-                        f.write(f"Timestamp: {datetime.now(pytz.UTC).isoformat()}\n")
-                        f.write(f"Model: {model}\n")
-                        f.write(f"Response Type: {type(response).__name__}\n")
-                        f.write(f"Has tool_calls: {hasattr(response, 'tool_calls') and bool(response.tool_calls)}\n")
-                        f.write(f"Content Length: {len(response.content)}\n")
-                        f.write("\n" + "="*80 + "\n")
-                        f.write("FULL RESPONSE CONTENT:\n")
-                        f.write("="*80 + "\n\n")
-                        f.write(response.content)
-                    logger.error(f"Saved full LLM response to {debug_file} for inspection")
-                except Exception as e:
-                    logger.debug(f"Failed to save debug file: {e}")
-                logger.debug(f"Response content preview: {response.content[:500]}...")
+                                    start_date = start_time.partition('T')[0]
+                                    end_time = f"{start_date}T{end_part}"
+                        elif tag == 'Summary':
+                            in_summary = True
+                            in_entities = False
+                            if value:
+                                summary_text = value
+                        elif tag == 'Key Entities':
+                            in_entities = True
+                            in_summary = False
+                        elif in_summary and stripped and not stripped.startswith('**'):
+                            summary_text += " " + stripped
+                        elif in_entities and stripped.startswith(('-', '*')):
+                            entity_match = ENTITY_LINE_RE.match(stripped)
+                            if entity_match:
+                                entity_text = entity_match.group(1)
+                                entities = [e.strip() for e in entity_text.split(',')]
+                                entities_list.extend(entities)
+
+                    if not title:
+                        title = section_title
+
+                    if title and (start_time or end_time):
+                        conv_start = start_time or chunk_start.isoformat()
+                        conv_end = end_time or chunk_end.isoformat()
+
+                        candidates.append({
+                            "title": title,
+                            "summary": summary_text.strip() if summary_text else "No summary available",
+                            "entities": entities_list[:10],
+                            "start": conv_start,
+                            "end": conv_end,
+                            "emoji": "💬",
+                        })
+                        logger.debug("Extracted conversation: %s", title)
+                    else:
+                        logger.debug("Skipped section - missing title or times. Title: %s, Start: %s, End: %s", title, start_time, end_time)
+                except Exception as md_e:
+                    logger.debug("Failed to parse markdown section %d: %s", idx, md_e, exc_info=True)
+            extracted_conversations = validate_conversations(candidates)
+            if extracted_conversations:
+                logger.info(f"Parsed {len(extracted_conversations)} conversations from markdown")
+            else:
+                logger.warning("Markdown parsing found 0 conversations")
+        except Exception as md_error:
+            logger.warning(f"Failed to parse markdown from content: {md_error}", exc_info=True)
+
+    if not extracted_conversations:
+        logger.error("No conversations found in chunk after all parsing attempts")
+        if hasattr(response, 'content') and response.content:
+            debug_file = os.path.expanduser('~/Library/mycelia/logs/llm_response_debug.txt')
+            try:
+                with open(debug_file, 'w') as f:
+                    f.write(f"Timestamp: {datetime.now(UTC).isoformat()}\n")
+                    f.write(f"Model: {model}\n")
+                    f.write(f"Response Type: {type(response).__name__}\n")
+                    f.write(f"Has tool_calls: {hasattr(response, 'tool_calls') and bool(response.tool_calls)}\n")
+                    f.write(f"Content Length: {len(response.content)}\n")
+                    f.write("\n" + "="*80 + "\n")
+                    f.write("FULL RESPONSE CONTENT:\n")
+                    f.write("="*80 + "\n\n")
+                    f.write(response.content)
+                logger.error(f"Saved full LLM response to {debug_file} for inspection")
+            except Exception as e:
+                logger.debug(f"Failed to save debug file: {e}")
+            logger.debug(f"Response content preview: {response.content[:500]}...")
+        return []
+
+    return extracted_conversations
+
+def store_conversations(extracted_conversations: list[Conversation], model: str = "small", conversation_ids: Optional[list] = None) -> int:
+    """
+    Write conversations, their entities and "mentioned in" relationships.
+    Passing the same `conversation_ids` again makes a retry fail on duplicate
+    ids instead of storing the conversations twice.
+    """
+    now = datetime.now(UTC)
+    objects_to_create = []
+    relationships_to_create = []
+
+    # Phase 1: Create conversation objects and collect (conversation, entity)
+    # mentions; the model may repeat an entity or pad it with whitespace
+    mentions = {}
+    for conv_idx, conv in enumerate(extracted_conversations):
+        conv_start, conv_end = sorted([utc(conv.start), utc(conv.end)])
+        objects_to_create.append(create_conversation_object(conv, conv_start, conv_end, now, model))
+
+        for entity_name in conv.entities:
+            if entity_name and (name := entity_name.strip()):
+                mentions[(conv_idx, name)] = None
+
+    # Phase 2: Resolve or create all entity objects in bulk
+    entity_to_id_map = bulk_resolve_entities((name for _, name in mentions), now)
+    for entity_name, entity_id in entity_to_id_map.items():
+        logger.info(f"Entity '{entity_name}' -> Object ID: {entity_id}")
+
+    # Phase 3: Create "mentioned in" relationships. Conversation ids are
+    # generated client-side (unless given) so relationships can reference
+    # them before the insert
+    if conversation_ids is None:
+        conversation_ids = [ObjectId() for _ in objects_to_create]
+    for conv_obj, conversation_id in zip(objects_to_create, conversation_ids):
+        conv_obj['_id'] = conversation_id
+
+    for conv_idx, entity_name in mentions:
+        entity_id = entity_to_id_map.get(entity_name)
+        if entity_id is not None:
+            relationships_to_create.append(create_mentioned_relationship(
+                entity_id, conversation_ids[conv_idx], entity_name, extracted_conversations[conv_idx].title, now
+            ))
+        else:
+            logger.warning(f"Entity '{entity_name}' not found in entity_to_id_map")
+
+    # Phase 4: Insert conversations and relationships in one batch
+    docs = objects_to_create + relationships_to_create
+    if docs:
+        result = call_resource("tech.mycelia.mongo", {
+            "action": "insertMany",
+            "collection": "objects",
+            "docs": docs
+        })
+        inserted_count = len(inserted_id_list(result))
+        if inserted_count != len(docs):
+            logger.error(f"Mismatch: {len(docs)} objects sent but {inserted_count} IDs returned. Result: {result}")
             return 0
 
-        now = datetime.now(pytz.UTC)
-        objects_to_create = []
-        relationships_to_create = []
-        entity_to_id_map = {}  # Track entity names to object IDs
-
-        # Phase 1: Create conversation objects and collect entities
-        for conv in extracted_conversations:
-            conv_start, conv_end = sorted([utc(conv.start), utc(conv.end)])
-
-            # Create conversation object
-            conv_obj = create_conversation_object(conv, conv_start, conv_end, now, model)
-            objects_to_create.append(conv_obj)
-
-            # Process entities for this conversation
-            for entity_name in conv.entities:
-                if not entity_name or not entity_name.strip():
-                    continue
-
-                # Track entity for relationship creation
-                if entity_name not in entity_to_id_map:
-                    entity_to_id_map[entity_name] = None  # Will be filled after object creation
-
-        # Phase 2: Create entity objects
-        for entity_name in entity_to_id_map:
-            entity_id = find_or_create_entity(entity_name, now)
-            entity_to_id_map[entity_name] = entity_id
-            logger.info(f"Entity '{entity_name}' -> Object ID: {entity_id}")
-
-        # Phase 3: Batch insert all objects
-        conversation_ids = []
-        if objects_to_create:
-            result = call_resource("tech.mycelia.mongo", {
-                "action": "insertMany",
-                "collection": "objects",
-                "docs": objects_to_create
-            })
-            inserted_ids = result.get('insertedIds', {})
-            if not inserted_ids:
-                logger.error(f"insertMany returned no insertedIds. Result: {result}")
-                return 0
-
-            if isinstance(inserted_ids, dict):
-                conversation_ids = [inserted_ids[i] for i in sorted(inserted_ids.keys())]
-            elif isinstance(inserted_ids, list):
-                conversation_ids = inserted_ids
-            else:
-                logger.error(f"Unexpected insertedIds type: {type(inserted_ids)}. Value: {inserted_ids}")
-                return 0
+        logger.info(f"Created {len(objects_to_create)} conversation objects")
+        logger.info(f"Created {len(relationships_to_create)} entity mention relationships")
 
-            logger.info(f"Created {len(conversation_ids)} conversation objects")
+    return len(extracted_conversations)
 
-        # Phase 4: Create relationships
-        if len(extracted_conversations) != len(conversation_ids):
-            logger.error(f"Mismatch: {len(extracted_conversations)} conversations extracted but {len(conversation_ids)} IDs returned")
-            return 0
+WRITER_QUEUE_SIZE = 100
+WRITER_BATCH_CONVERSATIONS = 50
+WRITER_BATCH_WAIT = 0.2  # seconds
+
+class ConversationWriter:
+    """
+    Write-behind store for extracted conversations. Workers hand their
+    results over and go straight back to the LLM while a single thread
+    writes them, coalescing what arrives within a short window into one
+    store_conversations call. Chunks whose conversations could not be
+    stored are collected in `failed` for the caller to check after `close`.
+    """
+
+    _STOP = object()
+
+    def __init__(self, model: str = "small", index: Optional[ConversationIndex] = None):
+        self.model = model
+        self.index = index
+        self.queue: queue.Queue = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+        # (chunk start, number of conversations) of chunks that failed to store
+        self.failed: list[tuple[datetime, int]] = []
+        self.thread = threading.Thread(target=self._run, name="convos-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, conversations: list[Conversation], chunk_start: datetime, replaces: frozenset = frozenset()):
+        """
+        Queue a chunk's conversations. `replaces` are ids of the objects they
+        supersede, handed to the index for deletion once the chunk is stored.
+        """
+        # Ids are fixed up front so a retried chunk can't be stored twice
+        self.queue.put((conversations, [ObjectId() for _ in conversations], chunk_start, replaces))
 
-        conv_idx = 0
-        for conv in extracted_conversations:
-            if conv_idx >= len(conversation_ids):
-                logger.warning(f"Conversation {conv_idx} not in conversation_ids (total: {len(conversation_ids)})")
+    def close(self):
+        """Flush everything queued so far and stop the writer thread."""
+        self.queue.put(self._STOP)
+        self.thread.join()
+
+    def _store(self, items: list) -> bool:
+        conversations = [conv for convs, _, _, _ in items for conv in convs]
+        conversation_ids = [_id for _, ids, _, _ in items for _id in ids]
+        try:
+            stored = store_conversations(conversations, self.model, conversation_ids) == len(conversations)
+        except Exception as e:
+            logger.error(f"Error storing {len(conversations)} conversations: {type(e).__name__}: {e}", exc_info=True)
+            return False
+        if stored and self.index is not None:
+            for _, _, _, replaces in items:
+                self.index.replace(replaces)
+        return stored
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is self._STOP:
                 break
-            conversation_id = conversation_ids[conv_idx]
-            conversation_title = conv.title
-
-            # Create "mentioned in" relationships for entities
-            for entity_name in conv.entities:
-                if not entity_name or not entity_name.strip():
-                    continue
-
-                entity_id = entity_to_id_map.get(entity_name)
-                if entity_id is not None:
-                    relationship = create_mentioned_relationship(
-                        entity_id, conversation_id, entity_name, conversation_title, now
-                    )
-                    relationships_to_create.append(relationship)
-                else:
-                    logger.warning(f"Entity '{entity_name}' not found in entity_to_id_map")
 
-            conv_idx += 1
+            items = [item]
+            count = len(item[0])
+            deadline = time.monotonic() + WRITER_BATCH_WAIT
+            while count < WRITER_BATCH_CONVERSATIONS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                items.append(item)
+                count += len(item[0])
+
+            if self._store(items):
+                continue
+            # One bad chunk must not take the rest of the batch down with it
+            if len(items) > 1:
+                logger.warning(f"Retrying {len(items)} chunks one at a time")
+                items = [item for item in items if not self._store([item])]
+            self.failed.extend((chunk_start, len(convs)) for convs, _, chunk_start, _ in items)
+
+def assign_to_chunks(conversations: list[Conversation], ranges: list[tuple[datetime, datetime]]) -> list[list[Conversation]]:
+    """
+    Split a group's conversations back into their chunks, by `chunk_index`
+    when the model set a valid one and by start time otherwise.
+    """
+    def distance(i: int, ts: datetime) -> timedelta:
+        start, end = ranges[i]
+        if start <= ts <= end:
+            return timedelta(0)
+        return min(abs(start - ts), abs(end - ts))
+
+    assigned = [[] for _ in ranges]
+    for conv in conversations:
+        idx = conv.chunk_index
+        if idx is None or not 0 <= idx < len(ranges):
+            conv_start = utc(conv.start)
+            idx = min(range(len(ranges)), key=lambda i: distance(i, conv_start))
+        assigned[idx].append(conv)
+    return assigned
+
+def process_conversation_group(
+        chunks: list[list[dict]],
+        tool_llm,
+        system_message: SystemMessage,
+        model: str = "small",
+        force: bool = False,
+        writer: Optional[ConversationWriter] = None,
+        index: Optional[ConversationIndex] = None,
+        cache: Optional[ResponseCache] = None,
+    ) -> list[int]:
+    """
+    Extract conversations for several chunks with one LLM call.
+    With a `writer` the results are queued for storage instead of written inline;
+    with an `index` existing conversations are looked up and replaced through it;
+    with a `cache` identical requests reuse an earlier tool call.
 
-        # Phase 5: Batch insert relationships
-        if relationships_to_create:
-            logger.debug(f"Creating {len(relationships_to_create)} relationships")
-            result = call_resource("tech.mycelia.mongo", {
-                "action": "insertMany",
-                "collection": "objects",
-                "docs": relationships_to_create
-            })
-            inserted_ids = result.get('insertedIds', {})
-            if isinstance(inserted_ids, dict):
-                inserted_count = len(inserted_ids)
-            elif isinstance(inserted_ids, list):
-                inserted_count = len(inserted_ids)
-            else:
-                inserted_count = 0
-            logger.info(f"Created {inserted_count} entity mention relationships")
+    Returns the number of conversations found per chunk, -1 for skipped chunks
+    (already extracted, or too short to be worth a call).
+    """
+    results = [0] * len(chunks)
+    candidates = []
+    pending = []
+    # Existing objects each chunk's new conversations supersede in force mode
+    replaces = {}
 
-        return len(extracted_conversations)
+    for idx, chunk in enumerate(chunks):
+        if is_trivial_chunk(chunk):
+            logger.info(f"Skipping trivial chunk at {chunk[0]['start'].strftime('%Y-%m-%d %H:%M')} ({chunk_text_length(chunk)} chars)")
+            results[idx] = -1
+            continue
+
+        prompt, chunk_start, chunk_end = chunk_to_prompt(chunk)
+
+        dur = int((chunk_end - chunk_start).total_seconds())
+        hours = dur // 3600
+        minutes = (dur % 3600) // 60
+        seconds = (dur % 60)
+        dur_str = f'{hours}h {minutes}m {seconds}s' if hours else f'{minutes}m {seconds}s'
+
+        logger.info(f"Processing chunk: {chunk_start.strftime('%Y-%m-%d %H:%M')} -> {chunk_end.strftime('%Y-%m-%d %H:%M')}")
+        logger.info(f"Duration: {dur_str}, Length: {len(prompt)} chars")
+
+        candidates.append((idx, prompt, chunk_start, chunk_end))
+
+    # One existence query for the whole group instead of one per chunk
+    if force:
+        already_extracted = [False] * len(candidates)
+    elif index is not None:
+        already_extracted = [index.exists(start, end) for _, _, start, end in candidates]
+    else:
+        already_extracted = ranges_with_conversations([(start, end) for _, _, start, end in candidates])
+
+    for (idx, prompt, chunk_start, chunk_end), exists in zip(candidates, already_extracted):
+        if exists:
+            logger.info(f"Conversations already exist for {chunk_start.strftime('%Y-%m-%d %H:%M')} -> {chunk_end.strftime('%Y-%m-%d %H:%M')}, skipping (use --force to recreate)")
+            results[idx] = -1
+            continue
+
+        if force and index is not None:
+            replaces[idx] = frozenset(index.overlapping(chunk_start, chunk_end))
+        elif force:
+            deleted_count = delete_conversations_in_range(chunk_start, chunk_end)
+            if deleted_count > 0:
+                logger.info(f"Force mode: recreating conversations for this time range")
+
+        pending.append((idx, prompt, chunk_start, chunk_end))
+
+    if not pending:
+        return results
+
+    if len(pending) == 1:
+        prompt = pending[0][1]
+    else:
+        prompt = "\n\n".join(
+            f"### CHUNK {n}\n{chunk_prompt}" for n, (_, chunk_prompt, _, _) in enumerate(pending)
+        )
+        logger.info(f"Sending {len(pending)} chunks in a single request ({len(prompt)} chars)")
+
+    try:
+        ranges = [(chunk_start, chunk_end) for _, _, chunk_start, chunk_end in pending]
+
+        cache_key = cache.key(system_message.content, prompt, model, PROMPT_VERSION) if cache else None
+        cached_args = cache.get(cache_key) if cache else None
+
+        if cached_args is not None:
+            extracted_conversations = conversations_from_tool_args(cached_args)
+            logger.info(f"Found {len(extracted_conversations)} conversations in the response cache")
+        else:
+            response = tool_llm.invoke([
+                system_message,
+                HumanMessage(content=prompt)
+            ])
+            extracted_conversations = parse_conversations(
+                response, min(r[0] for r in ranges), max(r[1] for r in ranges), model,
+            )
+            # Only well-formed tool calls are cached; fallback parses are retried
+            if cache and response.tool_calls:
+                cache.set(cache_key, response.tool_calls[0]["args"])
+
+        if len(pending) == 1:
+            per_chunk = [extracted_conversations]
+        else:
+            per_chunk = assign_to_chunks(extracted_conversations, ranges)
+
+        for (idx, _, chunk_start, _), conversations in zip(pending, per_chunk):
+            replaced = replaces.get(idx, frozenset())
+            if not conversations:
+                # Re-extracted with nothing in it, so the old ones just go
+                if replaced:
+                    index.replace(replaced)
+                continue
+            if writer is not None:
+                writer.put(conversations, chunk_start, replaced)
+                results[idx] = len(conversations)
+            else:
+                results[idx] = store_conversations(conversations, model)
+                if replaced and results[idx] == len(conversations):
+                    index.replace(replaced)
 
     except Exception as e:
         logger.error(f"Error processing chunk: {type(e).__name__}: {e}", exc_info=True)
-        return 0
 
-def extract_conversations(limit: Optional[int] = None, not_later_than: Optional[datetime] = None, model: str = "small", force: bool = False):
+    return results
+
+def process_conversation_chunk(chunk, tool_llm, system_message: SystemMessage, model: str = "small", force: bool = False):
+    """Process a single conversation chunk and extract conversations."""
+    return process_conversation_group([chunk], tool_llm, system_message, model, force)[0]
+
+def extract_conversations(
+        limit: Optional[int] = None,
+        not_later_than: Optional[datetime] = None,
+        model: str = "small",
+        force: bool = False,
+        workers: int = DEFAULT_WORKERS,
+        requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+        batch_size: int = DEFAULT_TRANSCRIPT_BATCH_SIZE,
+        use_cache: bool = True,
+    ):
     """Main function to extract conversations from transcripts."""
     logger.info("=" * 60)
     logger.info("Starting conversation extraction")
@@ -632,47 +1183,129 @@ def extract_conversations(limit: Optional[int] = None, not_later_than: Optional[
         logger.info("Force mode enabled: will recreate existing conversations")
     logger.info("=" * 60)
 
-    tool_llm, system_prompt = setup_llm_tools(model)
+    tool_llm, system_message = setup_llm_tools(model, requests_per_minute)
+
+    # Multikey index for the timeRanges overlap filters; with $elemMatch both
+    # bounds apply to the same array element, so they can share one index scan
+    call_resource("tech.mycelia.mongo", {
+        "action": "createIndex",
+        "collection": "objects",
+        "index": {"timeRanges.start": 1, "timeRanges.end": 1},
+    })
+    cache = ResponseCache() if use_cache else None
+    index = ConversationIndex(
+        not_later_than or datetime.now(UTC) + timedelta(days=1),
+        earliest_transcript_start(),
+    )
 
     processed = 0
     skipped = 0
+    trivial = 0
+    failed = 0
     total_conversations = 0
     cursor = not_later_than
     delta = SCALE_TO_RESOLUTION[scale]
 
     bucket_ranges = {}
 
-    try:
-        conv_iterator = iterate_conversations(cursor)
+    def collect(chunk: list[dict], conversations_found: int):
+        """Record the outcome of a finished chunk; runs on the main thread only."""
+        nonlocal processed, skipped, total_conversations
 
-        for chunk in conv_iterator:
-            if limit and processed >= limit:
-                logger.info(f"Reached limit of {limit} chunks")
-                break
+        chunk_start = chunk[0]["start"]
+        chunk_end = chunk[-1]["end"]
+        chunk_bucket = date_to_bucket(chunk_start, scale)
 
-            chunk_start = chunk[0]["start"]
-            chunk_end = chunk[-1]["end"]
-            chunk_bucket = date_to_bucket(chunk_start, scale)
-
-            conversations_found = process_conversation_chunk(chunk, tool_llm, system_prompt, model, force)
+        if conversations_found == -1:
+            skipped += 1
+            logger.debug(f"Skipped chunk in bucket {chunk_bucket}")
+        else:
+            total_conversations += conversations_found
+            processed += 1
 
-            if conversations_found == -1:
-                skipped += 1
-                logger.debug(f"Skipped chunk in bucket {chunk_bucket}")
+            if chunk_bucket not in bucket_ranges:
+                bucket_ranges[chunk_bucket] = {"start": chunk_start, "end": chunk_end}
             else:
-                total_conversations += conversations_found
-                processed += 1
+                bucket_ranges[chunk_bucket]["start"] = min(bucket_ranges[chunk_bucket]["start"], chunk_start)
+                bucket_ranges[chunk_bucket]["end"] = max(bucket_ranges[chunk_bucket]["end"], chunk_end)
+
+        if (processed + skipped) % 10 == 0:
+            logger.info(f"Progress: {processed} processed, {skipped} skipped, {total_conversations} conversations found")
+
+    def drain(in_flight: dict[Future, list[list[dict]]], *, all_done: bool = False):
+        done, _ = wait(in_flight, return_when=ALL_COMPLETED if all_done else FIRST_COMPLETED)
+        for future in done:
+            group = in_flight.pop(future)
+            for chunk, conversations_found in zip(group, future.result()):
+                collect(chunk, conversations_found)
+
+    def in_flight_chunks(in_flight: dict[Future, list[list[dict]]]) -> int:
+        return sum(len(group) for group in in_flight.values())
+
+    def substantive(chunks):
+        """Drop chunks too short to hold a conversation before they take a slot or count towards the limit."""
+        nonlocal trivial
+        for chunk in chunks:
+            if is_trivial_chunk(chunk):
+                trivial += 1
+                logger.debug(f"Skipping trivial chunk at {chunk[0]['start'].strftime('%Y-%m-%d %H:%M')} ({chunk_text_length(chunk)} chars)")
+                continue
+            yield chunk
 
-                if chunk_bucket not in bucket_ranges:
-                    bucket_ranges[chunk_bucket] = {"start": chunk_start, "end": chunk_end}
-                else:
-                    bucket_ranges[chunk_bucket]["start"] = min(bucket_ranges[chunk_bucket]["start"], chunk_start)
-                    bucket_ranges[chunk_bucket]["end"] = max(bucket_ranges[chunk_bucket]["end"], chunk_end)
-
-            cursor = chunk_start
+    try:
+        conv_iterator = iterate_conversations(cursor, batch_size)
 
-            if (processed + skipped) % 10 == 0:
-                logger.info(f"Progress: {processed} processed, {skipped} skipped, {total_conversations} conversations found")
+        # LLM calls are network-bound, so up to `workers` requests are in
+        # flight at once, each covering a group of one or more chunks.
+        # Submission and collection happen in separate steps so the pool
+        # actually overlaps calls instead of waiting on each result.
+        writer = ConversationWriter(model, index)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                in_flight: dict[Future, list[list[dict]]] = {}
+
+                for group in marshal_chunks(substantive(conv_iterator)):
+                    # Wait for a free slot; in-flight chunks count towards the
+                    # limit since each of them may end up processed
+                    while in_flight and (
+                        len(in_flight) >= workers
+                        or (limit and processed + in_flight_chunks(in_flight) + len(group) > limit)
+                    ):
+                        drain(in_flight)
+
+                    if limit and processed >= limit:
+                        logger.info(f"Reached limit of {limit} chunks")
+                        break
+                    if _shutdown.is_set():
+                        break
+                    if limit:
+                        group = group[:limit - processed]
+
+                    future = pool.submit(process_conversation_group, group, tool_llm, system_message, model, force, writer, index, cache)
+                    in_flight[future] = group
+                    cursor = group[-1][0]["start"]
+
+                if in_flight:
+                    drain(in_flight, all_done=True)
+        finally:
+            # Buckets are only marked once their conversations are written
+            writer.close()
+            if force:
+                index.flush_deletes()
+
+        # Chunks the writer gave up on are left for the next run
+        for chunk_start, conversations_lost in writer.failed:
+            processed -= 1
+            failed += 1
+            total_conversations -= conversations_lost
+            bucket_ranges.pop(date_to_bucket(chunk_start, scale), None)
+        if failed:
+            logger.error(f"Failed to store conversations of {failed} chunks; their buckets are not marked done")
+
+        if _shutdown.is_set() and cursor is not None:
+            # Chunks are processed newest first, so only the bucket holding
+            # the oldest submitted chunk can be left partially processed
+            bucket_ranges.pop(date_to_bucket(cursor, scale), None)
 
         for bucket, range_info in bucket_ranges.items():
             bucket_end = bucket + delta
@@ -687,6 +1320,8 @@ def extract_conversations(limit: Optional[int] = None, not_later_than: Optional[
     logger.info(f"Conversation extraction complete:")
     logger.info(f"  - Chunks processed: {processed}")
     logger.info(f"  - Chunks skipped: {skipped}")
+    logger.info(f"  - Chunks too short to process: {trivial}")
+    logger.info(f"  - Chunks failed to store: {failed}")
     logger.info(f"  - Conversations found: {total_conversations}")
     logger.info(f"  - Buckets marked done: {len(bucket_ranges)}")
     logger.info("=" * 60)
@@ -713,30 +1348,41 @@ Examples:
     parser.add_argument('--not-later-than', type=int, help='Process transcripts not later than this timestamp')
     parser.add_argument('--model', type=str, choices=['small', 'medium', 'large'], default='small', help='LLM size to use for extraction')
     parser.add_argument('--force', action='store_true', help='Force recreation of existing conversations (deletes and recreates)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of chunks processed concurrently')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help='Maximum LLM requests per minute')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_TRANSCRIPT_BATCH_SIZE, help='Number of transcripts fetched per Mongo query')
+    parser.add_argument('--no-cache', action='store_true', help='Always query the LLM instead of reusing cached responses')
+    parser.add_argument('--debug', action='store_true', help='Write debug messages to the log file')
     args = parser.parse_args()
 
-    setup_logging()
+    listener = setup_logging(args.debug)
+    try:
+        not_later_than = None
+        if args.not_later_than:
+            try:
+                not_later_than = datetime.fromtimestamp(args.not_later_than, tz=UTC)
+            except ValueError:
+                logger.error(f"Invalid datetime format: {args.not_later_than}")
+                return 1
 
-    not_later_than = None
-    if args.not_later_than:
         try:
-            not_later_than = datetime.fromtimestamp(args.not_later_than, tz=pytz.UTC)
-        except ValueError:
-            logger.error(f"Invalid datetime format: {args.not_later_than}")
+            extract_conversations(
+                limit=args.limit,
+                not_later_than=not_later_than,
+                model=args.model,
+                force=args.force,
+                workers=args.workers,
+                requests_per_minute=args.rpm,
+                batch_size=args.batch_size,
+                use_cache=not args.no_cache,
+            )
+        except Exception as e:
+            logger.exception(f"Error in main: {e}")
             return 1
 
-    try:
-        extract_conversations(
-            limit=args.limit,
-            not_later_than=not_later_than,
-            model=args.model,
-            force=args.force
-        )
-    except Exception as e:
-        logger.exception(f"Error in main: {e}")
-        return 1
-
-    return 0
+        return 0
+    finally:
+        listener.stop()
 
 if __name__ == '__main__':
     exit(main())
@@ -1,10 +1,12 @@
 #%%
 from discovery import Importer
+from chunking import opus_duration
 
 import logging
 from datetime import datetime, UTC
 from diarization import run_voice_activity_detection
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import platform
 
@@ -52,8 +54,23 @@ def import_new_files():
 importer_map = {importer.code: importer for importer in settings.importers}
 unknown_importer = Importer(code="unknown")
 
+STATE_FLUSH_SIZE = 25
+UPLOAD_WORKERS = 4
 
-def ingests_missing_sources(limit=None, retry_errors=False):
+
+def flush_ingestion_state(ops):
+    if not ops:
+        return
+    call_resource('tech.mycelia.mongo', {
+        "action": "bulkWrite",
+        "collection": "source_files",
+        "operations": ops,
+        "options": {"ordered": False},
+    })
+    ops.clear()
+
+
+def ingests_missing_sources(limit=None, retry_errors=False, max_workers=UPLOAD_WORKERS):
     base_query = {
         "ingested": False,
         "$or": [
@@ -68,26 +85,27 @@ def ingests_missing_sources(limit=None, retry_errors=False):
     if not retry_errors:
         base_query["ingestion.error"] = {"$exists": False}
 
-    total_pending = call_resource('tech.mycelia.mongo', {
-        "action": "count",
+    [counts] = call_resource('tech.mycelia.mongo', {
+        "action": "aggregate",
         "collection": "source_files",
-        "query": base_query
+        "pipeline": [{"$facet": {
+            "pending": [{"$match": base_query}, {"$count": "n"}],
+            "ingested": [{"$match": {"ingested": True}}, {"$count": "n"}],
+            "errored": [
+                {"$match": {
+                    "ingested": False,
+                    "ingestion.error": {"$exists": True}
+                }},
+                {"$count": "n"},
+            ],
+        }}],
     })
 
-    already_ingested = call_resource('tech.mycelia.mongo', {
-        "action": "count",
-        "collection": "source_files",
-        "query": {"ingested": True}
-    })
-
-    errored_count = call_resource('tech.mycelia.mongo', {
-        "action": "count",
-        "collection": "source_files",
-        "query": {
-            "ingested": False,
-            "ingestion.error": {"$exists": True}
-        }
-    })
+    # $count emits no document at all when nothing matched
+    total_pending, already_ingested, errored_count = (
+        counts[name][0]["n"] if counts[name] else 0
+        for name in ("pending", "ingested", "errored")
+    )
 
     total_files = already_ingested + total_pending + errored_count
 
@@ -100,56 +118,71 @@ def ingests_missing_sources(limit=None, retry_errors=False):
 
     logger.info(f"Starting ingestion: {total_pending} pending, {already_ingested} already ingested, {errored_count} errored (Total: {total_files} files)")
 
+    options = {
+        "projection": {"_id": 1, "path": 1, "platform": 1, "start": 1, "size": 1},
+        "sort": {"start": -1},
+    }
+    if limit:
+        options["limit"] = limit
+
     query = call_resource('tech.mycelia.mongo', {
         "action": "find",
         "collection": "source_files",
         "query": base_query,
-        "sort": [('start', -1)],
-        "limit": limit,
+        "options": options,
     })
 
     processed = 0
     errors = 0
-
-    for idx, source in enumerate(query, 1):
-        file_path = source.get('path', str(source['_id']))
-        file_name = os.path.basename(file_path) if 'path' in source else str(source['_id'])
-
-        logger.info(f"Processing [{idx}/{min(limit or total_pending, total_pending)}]: {file_name}")
-
-        try:
-            importer = importer_map.get(
-                source['platform'].get('importer'),
-                unknown_importer
-            )
-            importer.upload(source)
-            call_resource('tech.mycelia.mongo', {
-                "action": "updateOne",
-                "collection": "source_files",
-                "query": {"_id": source["_id"]},
-                "update": {"$set": {
-                "ingested": True,
-                "ingested_at": datetime.now(tz=UTC),
-            }}
-            })
-            processed += 1
-            logger.info(f"✓ Successfully ingested: {file_name}")
-        except Exception as e:
-            errors += 1
-            error_msg = str(e)
-            logger.error(f"✗ Error ingesting {file_name}: {error_msg[:100]}")
-
-            call_resource('tech.mycelia.mongo', {
-                "action": "updateOne",
-                "collection": "source_files",
-                "query": {"_id": source["_id"]},
-                "update": {"$set": {
-                    "ingestion": {
-                        "error": error_msg,
-                        "last_attempt": datetime.now(tz=UTC),
-                    }
-                }}
-            })
+    ops = []
+
+    def upload(source):
+        importer = importer_map.get(
+            source['platform'].get('importer'),
+            unknown_importer
+        )
+        importer.upload(source)
+
+    # Flush on the way out too, so already-uploaded sources are not re-uploaded
+    # next cycle if the batch is interrupted.
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(upload, source): source for source in query}
+            for idx, future in enumerate(as_completed(futures), 1):
+                source = futures[future]
+                file_path = source.get('path', str(source['_id']))
+                file_name = os.path.basename(file_path) if 'path' in source else str(source['_id'])
+
+                try:
+                    future.result()
+                    ops.append({"updateOne": {
+                        "filter": {"_id": source["_id"]},
+                        "update": {"$set": {
+                            "ingested": True,
+                            "ingested_at": datetime.now(tz=UTC),
+                        }}
+                    }})
+                    processed += 1
+                    logger.info(f"✓ [{idx}/{len(futures)}] Successfully ingested: {file_name}")
+                except Exception as e:
+                    errors += 1
+                    error_msg = str(e)
+                    logger.error(f"✗ [{idx}/{len(futures)}] Error ingesting {file_name}: {error_msg[:100]}")
+
+                    ops.append({"updateOne": {
+                        "filter": {"_id": source["_id"]},
+                        "update": {"$set": {
+                            "ingestion": {
+                                "error": error_msg,
+                                "last_attempt": datetime.now(tz=UTC),
+                            }
+                        }}
+                    }})
+
+                if len(ops) >= STATE_FLUSH_SIZE:
+                    flush_ingestion_state(ops)
+    finally:
+        flush_ingestion_state(ops)
 
     remaining = total_pending - processed - errors
     new_ingested_total = already_ingested + processed
@@ -169,7 +202,10 @@ def list_errored_files():
             "ingested": False,
             "ingestion.error": {"$exists": True}
         },
-        "sort": [('ingestion.last_attempt', -1)]
+        "options": {
+            "projection": {"_id": 1, "path": 1, "ingestion": 1},
+            "sort": {"ingestion.last_attempt": -1},
+        },
     })
 
     count = 0
@@ -227,19 +263,26 @@ def add_missing_durations():
     cursor = call_resource('tech.mycelia.mongo', {
         "action": "find",
         "collection": "source_files",
-        "query": query
+        "query": query,
+        "options": {"projection": {"_id": 1, "start": 1}},
     })
     for original in cursor:
         # Find the latest chunk for this original
         latest_chunk = call_resource('tech.mycelia.mongo', {
             "action": "findOne",
             "collection": "audio_chunks",
-            "query": {"meta.original_id": original["_id"]},
-            "sort": [("start", -1)],
-            "limit": 1
+            "query": {"original_id": original["_id"]},
+            "options": {
+                "projection": {"_id": 0, "data": 1, "start": 1},
+                "sort": {"start": -1},
+            },
         })
         if latest_chunk:
-            end = latest_chunk["start"] + timedelta(seconds=AudioSegment.from_file(io.BytesIO(latest_chunk['data']), format="ogg").duration_seconds)
+            try:
+                chunk_duration = opus_duration(latest_chunk['data'])
+            except ValueError:
+                chunk_duration = AudioSegment.from_file(io.BytesIO(latest_chunk['data']), format="ogg").duration_seconds
+            end = latest_chunk["start"] + timedelta(seconds=chunk_duration)
             duration = end - original["start"]
             call_resource('tech.mycelia.mongo', {
                 "action": "updateOne",
@@ -254,24 +297,25 @@ def add_missing_durations():
 
 
 def add_missing_ends():
-    for original in call_resource('tech.mycelia.mongo', {
-        "action": "find",
+    # The update is a pipeline so the server computes end from each doc's own
+    # start and duration; bulkWrite passes it through as-is, unlike updateMany.
+    call_resource('tech.mycelia.mongo', {
+        "action": "bulkWrite",
         "collection": "source_files",
-        "query": {
-            "duration": {"$exists": True},
-            "end": {"$exists": False}
-        }
-    }):
-        call_resource('tech.mycelia.mongo', {
-            "action": "updateOne",
-            "collection": "source_files",
-            "query": {"_id": original["_id"]},
-            "update": {
-                "$set": {
-                    "end": original["start"] + timedelta(seconds=original["duration"])
-                }
+        "operations": [{
+            "updateMany": {
+                "filter": {
+                    "duration": {"$exists": True},
+                    "end": {"$exists": False}
+                },
+                "update": [{
+                    "$set": {
+                        "end": {"$add": ["$start", {"$multiply": ["$duration", 1000]}]}
+                    }
+                }]
             }
-        })
+        }]
+    })
 
 #%%
 
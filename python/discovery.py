@@ -43,7 +43,7 @@ _known_discovered_cache = lazy(lambda: set(d['path'] for d in call_resource('tec
     "query": {
         "path": {"$exists": True}
     },
-    "projection": {"path": 1, "_id": 0},
+    "options": {"projection": {"path": 1, "_id": 0}},
 })))
 
 
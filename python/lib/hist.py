@@ -1,7 +1,6 @@
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
 from typing import Literal
 
-import pytz
 from .resources import call_resource
 from pydantic import BaseModel
 
@@ -25,7 +24,7 @@ SMALLEST_SCALE = "5min"
 
 def date_to_bucket(date: datetime, scale: Scale) -> datetime:
     step = SCALE_TO_RESOLUTION[scale].total_seconds()
-    return datetime.fromtimestamp((date.timestamp() // step) * step, tz=pytz.UTC)
+    return datetime.fromtimestamp((date.timestamp() // step) * step, tz=timezone.utc)
 
 
 def ensure_buckets_exist(start: datetime, end: datetime, scale: Scale):
@@ -33,8 +32,8 @@ def ensure_buckets_exist(start: datetime, end: datetime, scale: Scale):
     operations = [
         {
             "updateOne": {
-                "filter": {"start": datetime.fromtimestamp(bucket * step, tz=pytz.UTC)},
-                "update": {"$set": {"start": datetime.fromtimestamp(bucket * step, tz=pytz.UTC)}},
+                "filter": {"start": datetime.fromtimestamp(bucket * step, tz=timezone.utc)},
+                "update": {"$set": {"start": datetime.fromtimestamp(bucket * step, tz=timezone.utc)}},
                 "upsert": True,
             }
         }
@@ -74,7 +73,7 @@ def mark_buckets_as(
         start -= delta
         end += delta
 
-    now = datetime.now(tz=pytz.UTC)
+    now = datetime.now(tz=timezone.utc)
     now_bucket = date_to_bucket(now, scale)
 
     query = {"start": {"$gte": start, "$lte": end - delta}}
@@ -88,7 +87,7 @@ def mark_buckets_as(
             "action": "updateMany",
             "collection": f"histogram_{scale}",
             "query": query,
-            "update": {"$set": {f"{worker}.status": status, "updated_at": datetime.now(tz=pytz.UTC) }},
+            "update": {"$set": {f"{worker}.status": status, "updated_at": datetime.now(tz=timezone.utc) }},
         }
     )
 
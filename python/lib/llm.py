@@ -25,8 +25,8 @@ class ChatMycelia(ChatOpenAI):
         super().__init__(*args, **kwargs)
 
 
-def get_llm(model) -> ChatMycelia:
-    return ChatMycelia(model=model)
+def get_llm(model, **kwargs) -> ChatMycelia:
+    return ChatMycelia(model=model, **kwargs)
 
 
 small_llm = get_llm('small')
@@ -0,0 +1,54 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import orjson
+
+
+CACHE_PATH = os.path.expanduser('~/Library/mycelia/llm_cache.db')
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of LLM tool-call arguments keyed by a hash of
+    everything that determines the response, so reruns skip the request.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "hash TEXT PRIMARY KEY, response TEXT NOT NULL, created_at INTEGER NOT NULL)"
+            )
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response FROM responses WHERE hash = ? AND created_at >= ?",
+                (key, int(time.time()) - self.ttl_seconds),
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (hash, response, created_at) VALUES (?, ?, ?)",
+                (key, orjson.dumps(value).decode(), int(time.time())),
+            )
@@ -5,58 +5,76 @@ import json
 
 
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timezone
 import base64
-import pytz
+import mmap
+import orjson
+
+
+def ejson_default(obj):
+    if isinstance(obj, ObjectId):
+        return {"$oid": str(obj)}
+    if isinstance(obj, datetime):
+        utc = obj if obj.tzinfo is timezone.utc else obj.astimezone(timezone.utc)
+        return {"$date": utc.isoformat().replace( "+00:00", "Z")}
+    if isinstance(obj, (bytes, bytearray, memoryview, mmap.mmap)):
+        return {
+            "$binary": {
+                "base64": base64.b64encode(obj).decode('ascii'),
+                "subType": "00",
+            }
+        }
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def ejson_object_hook(dct):
+    if "$oid" in dct:
+        return ObjectId(dct["$oid"])
+    if "$date" in dct:
+        iso = dct["$date"]
+        if iso.endswith("Z"):
+            iso = iso[:-1] + "+00:00"
+        return datetime.fromisoformat(iso)
+    if "$binary" in dct:
+        binary_data = dct["$binary"]
+        base64_str = binary_data["base64"]
+        if binary_data.get("subType", "00") != "00":
+            raise ValueError
+        return base64.b64decode(base64_str)
+    return dct
 
 
 class EJsonEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return {"$oid": str(obj)}
-        if isinstance(obj, datetime):
-            utc = obj.astimezone(pytz.utc)
-            return {"$date": utc.isoformat().replace( "+00:00", "Z")}
-        if isinstance(obj, bytes):
-            return {
-                "$binary": {
-                    "base64": base64.b64encode(obj).decode(),
-                    "subType": "00",
-                }
-            }
-        return super().default(obj)
+        try:
+            return ejson_default(obj)
+        except TypeError:
+            return super().default(obj)
 
 
 class EJsonDecoder(json.JSONDecoder):
     def __init__(self, *args, **kwargs):
-        kwargs['object_hook'] = self._object_hook
+        kwargs['object_hook'] = ejson_object_hook
         super().__init__(*args, **kwargs)
 
-    @staticmethod
-    def _object_hook(dct):
-        if "$oid" in dct:
-            return ObjectId(dct["$oid"])
-        if "$date" in dct:
-            iso = dct["$date"]
-            if iso.endswith("Z"):
-                iso = iso[:-1] + "+00:00"
-            return datetime.fromisoformat(iso)
-        if "$binary" in dct:
-            binary_data = dct["$binary"]
-            base64_str = binary_data["base64"]
-            if binary_data.get("subType", "00") != "00":
-                raise ValueError
-            return base64.b64decode(base64_str)
-        return dct
+
+def _from_ejson(value):
+    # orjson has no object_hook; apply it bottom-up like json does
+    if isinstance(value, dict):
+        return ejson_object_hook({k: _from_ejson(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_from_ejson(v) for v in value]
+    return value
 
 
 def call_resource(resource_name: str, body: dict) -> Any:
     ensure_authorized()
     response = session.post(
         get_url("api", "resource", resource_name),
-        data=json.dumps(body, cls=EJsonEncoder),
+        # datetimes are passed through so they are sent as EJSON $date
+        data=orjson.dumps(body, default=ejson_default, option=orjson.OPT_PASSTHROUGH_DATETIME),
         headers={"Content-Type": "application/json"},
         timeout=600,
     )
     response.raise_for_status()
-    return json.loads(response.text, cls=EJsonDecoder)
+    return _from_ejson(orjson.loads(response.content))
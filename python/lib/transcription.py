@@ -1,4 +1,7 @@
 import re
+from functools import lru_cache
+
+from .resources import call_resource
 
 known_errors = {
     'Продолжение следует...',
@@ -34,3 +37,17 @@ remove_if_lonely = {
     'Obrigado.',
     'Dziękuję.',
 }
+
+
+# Serves both the newest-first keyset walk in convos and the start range
+# scans in cleanup
+TRANSCRIPT_INDEX = {"start": -1, "_id": -1}
+
+
+@lru_cache(maxsize=None)
+def ensure_transcript_index():
+    call_resource("tech.mycelia.mongo", {
+        "action": "createIndex",
+        "collection": "transcriptions",
+        "index": TRANSCRIPT_INDEX,
+    })